@@ -0,0 +1,109 @@
+"""Stored size, write and read time of cached values per codec.
+
+Values are encoded as splint_cached_property does and pickled as the Django
+cache backends store them. The previous read path (value stored as is, then
+a speculative `json.loads` of any non-dict value) is measured as a baseline.
+Codecs whose packages are not installed (msgpack, lz4) are skipped.
+
+Usage: python benchmarks/bench_cache_codecs.py [rows] [repeat]
+"""
+import json
+import pickle
+import random
+import sys
+import time
+
+import django
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(LOGGING_CONFIG=None)
+    django.setup()
+
+from django.core.exceptions import ImproperlyConfigured  # noqa: E402
+
+from django_splint.utils.cache import ValueCodec, decode_value  # noqa: E402
+
+CODECS = [
+    (serializer, compression)
+    for serializer in ('pickle', 'json', 'msgpack')
+    for compression in (None, 'zlib', 'lz4')
+]
+
+
+def make_payloads(rows):
+    """API-like rows, a list of ids and rows cached as a JSON string."""
+    rng = random.Random(0)
+    words = ['math', 'history', 'science', 'art', 'music', 'sports', 'lab']
+    data = [
+        {
+            'id': i,
+            'name': f'Student {i}',
+            'email': f'student{i}@school.example',
+            'created': f'2024-{rng.randint(1, 12):02d}-'
+                       f'{rng.randint(1, 28):02d}T10:00:00Z',
+            'score': round(rng.uniform(0, 10), 2),
+            'active': rng.random() > 0.1,
+            'groups': rng.sample(words, 3),
+        }
+        for i in range(rows)
+    ]
+    return {
+        'rows': data,
+        'ids': [row['id'] * 7 for row in data] * 10,
+        'json_text': json.dumps(data),
+    }
+
+
+def previous_read(stored):
+    value = pickle.loads(stored)
+    if not isinstance(value, dict):
+        try:
+            value = json.loads(value)
+        except:  # noqa: E722
+            pass
+    return value
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def measure(payload, repeat, codec=None):
+    if codec is None:
+        write_ms, stored = timed(
+            lambda: pickle.dumps(payload, pickle.HIGHEST_PROTOCOL), repeat)
+        read_ms, _ = timed(lambda: previous_read(stored), repeat)
+    else:
+        write_ms, stored = timed(lambda: pickle.dumps(
+            codec.encode(payload), pickle.HIGHEST_PROTOCOL), repeat)
+        read_ms, _ = timed(
+            lambda: decode_value(pickle.loads(stored)), repeat)
+    return len(stored), write_ms, read_ms
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    variants = [('previous', None)]
+    for serializer, compression in CODECS:
+        label = '+'.join(filter(None, (serializer, compression)))
+        try:
+            variants.append((label, ValueCodec(serializer, compression)))
+        except ImproperlyConfigured:
+            print(f'{label} skipped (not installed)')
+
+    for name, payload in make_payloads(rows).items():
+        print(f'{name} ({rows} rows):')
+        for label, codec in variants:
+            size, write_ms, read_ms = measure(payload, repeat, codec)
+            print(f'  {label:<15} {size / 1024:>9.1f} KB  '
+                  f'write {write_ms:>7.2f} ms  read {read_ms:>7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Model hydration rate of SplintModel with and without the field snapshot.
+
+The baseline is SplintModel as it was before change tracking: no from_db
+snapshot, `original_value_fields` read back in __init__.
+
+Usage: python benchmarks/bench_hydration.py [rows]
+"""
+import sys
+import time
+
+import django
+from django.conf import settings
+
+settings.configure(
+    INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth'],
+    DATABASES={'default': {
+        'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+    USE_TZ=True,
+    LOGGING_CONFIG=None,
+)
+django.setup()
+
+from django.db import connection, models  # noqa: E402
+
+from django_splint.db.models import SplintModel  # noqa: E402
+
+
+class Plain(models.Model):
+    name = models.CharField(max_length=50)
+    email = models.CharField(max_length=50)
+    score = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'bench'
+
+
+class Baseline(models.Model):
+    name = models.CharField(max_length=50)
+    email = models.CharField(max_length=50)
+    score = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    _deleted = models.BooleanField(default=False)
+    _deleted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'bench'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for f in getattr(self._meta, 'original_value_fields', ()):
+            setattr(self, f'__original_{f}', getattr(self, f))
+
+
+class Default(SplintModel):
+    name = models.CharField(max_length=50)
+    email = models.CharField(max_length=50)
+    score = models.IntegerField()
+
+    class Meta(SplintModel.Meta):
+        app_label = 'bench'
+
+
+class NoSnapshot(SplintModel):
+    name = models.CharField(max_length=50)
+    email = models.CharField(max_length=50)
+    score = models.IntegerField()
+
+    class Meta(SplintModel.Meta):
+        app_label = 'bench'
+        track_changes = False
+
+
+class Snapshot(SplintModel):
+    name = models.CharField(max_length=50)
+    email = models.CharField(max_length=50)
+    score = models.IntegerField()
+
+    class Meta(SplintModel.Meta):
+        app_label = 'bench'
+        original_value_fields = ('name', 'score')
+
+
+def populate(model, rows):
+    with connection.schema_editor() as editor:
+        editor.create_model(model)
+    model._base_manager.bulk_create(
+        model(name=f'name {i}', email=f'{i}@splint.dev', score=i)
+        for i in range(rows))
+
+
+def hydrate(model, rows, queryset=None):
+    queryset = model._base_manager.all() if queryset is None else queryset
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        count = sum(1 for _ in queryset.all().iterator(chunk_size=2000))
+        elapsed = time.perf_counter() - start
+        assert count == rows
+        best = elapsed if best is None else min(best, elapsed)
+    return rows / best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for model in (Plain, Baseline, Default, NoSnapshot, Snapshot):
+        populate(model, rows)
+
+    results = [
+        ('django Model', hydrate(Plain, rows)),
+        ('baseline SplintModel', hydrate(Baseline, rows)),
+        ('SplintModel (change tracking)', hydrate(Default, rows)),
+        ('SplintModel without snapshot', hydrate(NoSnapshot, rows)),
+        ('SplintModel with original fields', hydrate(Snapshot, rows)),
+        ('SplintModel with original fields, only()', hydrate(
+            Snapshot, rows, Snapshot._base_manager.only('id', 'email'))),
+    ]
+
+    print(f'Hydration of {rows} rows (best of 3):')
+    for name, rate in results:
+        print(f'  {name:<42} {rate:>12,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
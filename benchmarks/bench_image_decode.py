@@ -0,0 +1,146 @@
+"""Time and peak RSS of SplintImageField processing per image.
+
+Compares the previous decode path (full decode, resize, temporary file on
+disk) with the current one (JPEG draft mode, reduce, in-memory output). Each
+variant runs in its own process so its peak RSS is not shared.
+
+Sources whose sizes are not multiples of the DCT scale (draft mode rounds
+each axis on its own) are processed first, as a regression check.
+
+Usage: python benchmarks/bench_image_decode.py [megapixels] [images]
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from tempfile import NamedTemporaryFile
+
+import django
+from django.conf import settings
+
+MEDIA_ROOT = os.path.join(tempfile.gettempdir(), 'splint-bench-media')
+
+if not settings.configured:
+    settings.configure(
+        INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth'],
+        DATABASES={'default': {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        MEDIA_ROOT=MEDIA_ROOT,
+        USE_TZ=True,
+        LOGGING_CONFIG=None,
+    )
+    django.setup()
+
+from django.core.files import File  # noqa: E402
+from django.db import models  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from django_splint.db.fields import SplintImageField  # noqa: E402
+
+WIDTH = 768
+
+
+# Sizes not divisible by 8, processed with and without vertical crop.
+ODD_SIZES = [(4242, 2828), (3001, 2001), (1283, 4099), (803, 605)]
+
+
+class Photo(models.Model):
+    image = SplintImageField(upload_to='bench', width=WIDTH)
+    cropped = SplintImageField(
+        upload_to='bench', width=WIDTH, vertical_crop=37)
+
+    class Meta:
+        app_label = 'bench'
+
+
+def make_source(megapixels):
+    """Noisy RGB JPEG of about `megapixels` million pixels (3:2)."""
+    height = int((megapixels * 1e6 / 1.5) ** 0.5)
+    width = int(height * 1.5)
+    path = os.path.join(MEDIA_ROOT, f'source_{megapixels}mp.jpg')
+    if not os.path.exists(path):
+        os.makedirs(MEDIA_ROOT, exist_ok=True)
+        base = Image.linear_gradient('L').resize((width, height))
+        noise = Image.effect_noise((width, height), 48)
+        Image.merge('RGB', (base, noise, Image.blend(base, noise, 0.5))).save(
+            path, 'JPEG', quality=90)
+    return path
+
+
+def previous(path):
+    """Decode path before draft mode and in-memory output."""
+    im = Image.open(path)
+    width = min(WIDTH, im.width)
+    height = min(int(im.height * width / im.width), im.height)
+    im = im.resize((width, height), Image.LANCZOS)
+    with NamedTemporaryFile() as temp_file:
+        im.convert('RGB').save(temp_file, quality=80, format='JPEG')
+
+
+def current(path):
+    with open(path, 'rb') as f:
+        photo = Photo(image=File(f, name='source.jpg'))
+        Photo._meta.get_field('image').process(photo.image)
+    os.remove(photo.image.path)
+
+
+def check_odd_sizes():
+    """Process JPEGs of ODD_SIZES, returns the failures."""
+    failures = []
+    for size in ODD_SIZES:
+        path = os.path.join(MEDIA_ROOT, f'odd_{size[0]}x{size[1]}.jpg')
+        os.makedirs(MEDIA_ROOT, exist_ok=True)
+        Image.linear_gradient('L').resize(size).save(path, 'JPEG')
+        for name in ('image', 'cropped'):
+            field = Photo._meta.get_field(name)
+            with open(path, 'rb') as f:
+                photo = Photo(**{name: File(f, name='odd.jpg')})
+                try:
+                    field.process(getattr(photo, name))
+                except Exception as exc:
+                    failures.append(f'{size} {name}: {exc!r}')
+                    continue
+            os.remove(getattr(photo, name).path)
+        os.remove(path)
+    return failures
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def measure(variant, path, images):
+    baseline = max_rss_mb()
+    start = time.perf_counter()
+    for _ in range(images):
+        variant(path)
+    elapsed = time.perf_counter() - start
+    return elapsed / images, baseline, max_rss_mb()
+
+
+def main():
+    megapixels = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    images = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    # Peak RSS is inherited by child processes, keep this one small.
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        failures = pool.apply(check_odd_sizes)
+        path = pool.apply(make_source, (megapixels,))
+    if failures:
+        sys.exit('Processing failed:\n' + '\n'.join(failures))
+
+    print(f'{images} images of {megapixels} MP resized to {WIDTH}px wide:')
+    for name, variant in (('previous', previous), ('current', current)):
+        with context.Pool(1) as pool:
+            per_image, baseline, peak = pool.apply(
+                measure, (variant, path, images))
+        print(f'  {name:<10} {per_image * 1000:>8.1f} ms/image  '
+              f'peak RSS {peak:>7.1f} MB (+{peak - baseline:.1f} MB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('activity')
+
+DEFAULT_HANDLER = 'django_splint.activity.LoggerActivityHandler'
+
+
+class ActivityJSONEncoder(DjangoJSONEncoder):
+    """JSON encoder falling back to `str` for unknown values (files...)."""
+
+    def default(self, o):
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+def dumps(record):
+    """Serialize an activity record to JSON."""
+    return json.dumps(record, cls=ActivityJSONEncoder)
+
+
+class LoggerActivityHandler:
+    """Write activity records to the `activity` logger."""
+
+    def emit(self, records):
+        for record in records:
+            logger.info(record)
+
+
+class FileActivityHandler:
+    """Append activity records as JSON lines to a file."""
+
+    def __init__(self, path):
+        """Constructor."""
+        self.path = path
+
+    def emit(self, records):
+        with open(self.path, 'a') as f:
+            f.write(''.join(dumps(record) + '\n' for record in records))
+
+
+class ModelActivityHandler:
+    """Bulk insert activity records in a database table.
+
+    The model (given as 'app_label.ModelName') must have the fields `action`,
+    `origin`, `user`, `model`, `object` and `changes` (JSONFields).
+    """
+
+    def __init__(self, model):
+        """Constructor."""
+        self.model = model
+
+    def emit(self, records):
+        model = apps.get_model(self.model)
+        model._base_manager.bulk_create(
+            [model(**json.loads(dumps(record))) for record in records])
+
+
+class SQSActivityHandler:
+    """Send activity records to an AWS SQS queue, ten per request."""
+
+    def __init__(self, queue_url):
+        """Constructor."""
+        self.queue_url = queue_url
+
+    def emit(self, records):
+        from django_splint.utils.aws.sqs import AWSSQSHandler
+
+        handler = AWSSQSHandler()
+        for i in range(0, len(records), 10):
+            handler.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {'Id': str(n), 'MessageBody': dumps(record)}
+                    for n, record in enumerate(records[i:i + 10])
+                ])
+
+
+class ActivityLogBuffer:
+    """Bounded in-memory queue of activity records.
+
+    Records are written in batches by a background thread. When the queue is
+    full, `put` waits up to `block_timeout` seconds (backpressure) and then
+    drops the record, counting it in `dropped`.
+    """
+
+    def __init__(self, handler, max_size=10000, batch_size=500,
+                 flush_interval=1.0, block_timeout=0):
+        """Constructor."""
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=max_size)
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def stats(self):
+        """Counters of the buffer."""
+        return {
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'written': self.written,
+            'failed': self.failed,
+            'pending': self.queue.qsize(),
+        }
+
+    def put(self, records):
+        """Enqueue activity records, never raising when the queue is full."""
+        self._ensure_thread()
+
+        enqueued = dropped = 0
+        for record in records:
+            try:
+                if self.block_timeout:
+                    self.queue.put(record, timeout=self.block_timeout)
+                else:
+                    self.queue.put_nowait(record)
+                enqueued += 1
+            except queue.Full:
+                dropped += 1
+
+        with self._lock:
+            self.enqueued += enqueued
+            self.dropped += dropped
+
+    def flush(self):
+        """Write every pending record in the current thread."""
+        while True:
+            batch = self._next_batch(timeout=None)
+            if not batch:
+                break
+            self._write(batch)
+
+    def _ensure_thread(self):
+        """Start the flusher thread (again, after a fork)."""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name='splint-activity-log', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch(timeout=self.flush_interval)
+            if batch:
+                # The thread keeps its own DB connection (ModelActivityHandler)
+                close_old_connections()
+                try:
+                    self._write(batch)
+                finally:
+                    close_old_connections()
+
+    def _next_batch(self, timeout):
+        try:
+            if timeout is None:
+                batch = [self.queue.get_nowait()]
+            else:
+                batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            self.handler.emit(batch)
+        except Exception:
+            with self._lock:
+                self.failed += len(batch)
+            logging.getLogger(__name__).exception(
+                'Failed to write %s activity records.', len(batch))
+        else:
+            with self._lock:
+                self.written += len(batch)
+
+
+_handler = None
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_activity_handler():
+    """Handler configured at `SPLINT_ACTIVITY_LOG_HANDLER`."""
+    global _handler
+    if _handler is None:
+        handler_class = import_string(getattr(
+            settings, 'SPLINT_ACTIVITY_LOG_HANDLER', DEFAULT_HANDLER))
+        _handler = handler_class(**getattr(
+            settings, 'SPLINT_ACTIVITY_LOG_HANDLER_OPTIONS', {}))
+    return _handler
+
+
+def get_activity_buffer():
+    """Process wide activity log buffer."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ActivityLogBuffer(
+                    get_activity_handler(),
+                    max_size=getattr(
+                        settings, 'SPLINT_ACTIVITY_LOG_QUEUE_SIZE', 10000),
+                    batch_size=getattr(
+                        settings, 'SPLINT_ACTIVITY_LOG_BATCH_SIZE', 500),
+                    flush_interval=getattr(
+                        settings, 'SPLINT_ACTIVITY_LOG_FLUSH_INTERVAL', 1.0),
+                    block_timeout=getattr(
+                        settings, 'SPLINT_ACTIVITY_LOG_BLOCK_TIMEOUT', 0),
+                )
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+def activity_record(model, action, obj, origin=None, user=None,
+                    changes=None):
+    """Build the activity log record of an action over a model object.
+
+    `changes` ({field: [old, new]}) is added to the record when given.
+    """
+    record = {
+        'action': action,
+        'origin': origin,
+        'user': user,
+        'model': model.__name__,
+        'object': obj,
+    }
+    if changes is not None:
+        record['changes'] = changes
+    return record
+
+
+def log_activities(records, using=None):
+    """Log a batch of activity records.
+
+    With `SPLINT_ACTIVITY_LOG_BUFFERED = True` records are enqueued in the
+    activity log buffer when the current transaction commits, otherwise they
+    are written right away by the configured handler.
+    """
+    if not records:
+        return
+
+    if not getattr(settings, 'SPLINT_ACTIVITY_LOG_BUFFERED', False):
+        get_activity_handler().emit(records)
+        return
+
+    buffer = get_activity_buffer()
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(lambda: buffer.put(records), using=using)
+    else:
+        buffer.put(records)
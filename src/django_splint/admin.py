@@ -4,8 +4,9 @@ from django.contrib import admin
 from django.core.exceptions import FieldError
 
 from import_export.admin import ExportActionMixin
+from import_export.resources import ModelResource, modelresource_factory
 
-from django_splint.db.models import SplintModel
+from django_splint.db.models import SplintModel, SplintQuerySet
 
 
 try:
@@ -14,6 +15,19 @@ except AttributeError:
     EXTRA_CSS = '/static/css/custom_admin.css'
 
 
+class SplintModelResource(ModelResource):
+    """Export SplintQuerySets in keyset chunks with constant memory."""
+
+    def iter_queryset(self, queryset):
+        """Iterate querysets by primary key chunks."""
+        if not isinstance(queryset, SplintQuerySet):
+            yield from super().iter_queryset(queryset)
+            return
+
+        yield from queryset.iter_chunks(
+            self.get_chunk_size(), key='pk', flat=True)
+
+
 class SplintBaseAdminMixin(object):
     exclude = ['_deleted', '_deleted_at']
 
@@ -106,6 +120,14 @@ class SplintModelAdminMixin(SplintBaseAdminMixin):
 class SplintModelAdmin(ExportActionMixin, SplintModelAdminMixin, admin.ModelAdmin):
     ordering = ('-created_at',)
 
+    def get_resource_classes(self, *args, **kwargs):
+        """Export with SplintModelResource when no resource is declared."""
+        if not (getattr(self, 'resource_classes', None) or
+                getattr(self, 'resource_class', None)):
+            return [modelresource_factory(
+                self.model, resource_class=SplintModelResource)]
+        return super().get_resource_classes(*args, **kwargs)
+
 
 class SplintReadOnlyAdminMixin:
 
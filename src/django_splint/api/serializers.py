@@ -1,10 +1,20 @@
 import base64
+import operator
 import six
 import uuid
+from functools import reduce
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.exceptions import ValidationError
-from rest_framework import serializers
+from django.db import IntegrityError, models, transaction
+from rest_framework import serializers, status
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils import html
+from rest_framework.utils import model_meta
+
+from django_splint.utils.decorators import prefetch_cached_properties
 
 
 class SplintSerializerMixin:
@@ -35,8 +45,401 @@ class SplintSerializerMixin:
         return data
 
 
+class SplintListSerializer(serializers.ListSerializer):
+    """List serializer prefetching the child `Meta.prefetch_cached_properties`."""
+
+    def to_representation(self, data):
+        names = getattr(
+            getattr(self.child, 'Meta', None), 'prefetch_cached_properties', None)
+        if names:
+            if isinstance(data, models.Manager):
+                data = data.all()
+            data = prefetch_cached_properties(data, *names)
+        return super().to_representation(data)
+
+
+class SplintBulkListSerializer(SplintListSerializer):
+    """List serializer creating and updating its items in bulk.
+
+    Items are validated in one pass (primary keys of related fields are
+    fetched with one query per field) and written in chunks of
+    `Meta.bulk_batch_size` (`SPLINT_BULK_BATCH_SIZE`, default 500) of the
+    child serializer, in a transaction: created with `bulk_create` and
+    updated with one `bulk_update` per set of changed fields. SplintModel
+    logs the activity of each chunk at once. Models `save()` is not called.
+
+    Given a queryset as instance, items are updates of its objects matched
+    by primary key, fetched with one query. With `bulk_key_fields` in the
+    context, they are matched by these fields instead and the items without
+    a match are created (upsert), unless their key is held by a row out of
+    the queryset, e.g. soft deleted.
+
+    Items repeating unique values of a previous item of the list are
+    invalid. With `Meta.bulk_errors = 'atomic'` (default) nothing is written
+    when an item is invalid or conflicts with existing data. With 'partial'
+    the valid items are written and the errors of the others are kept by
+    index at `item_errors`. Lists over `Meta.bulk_max_items`
+    (`SPLINT_BULK_MAX_ITEMS`, default 5000) items are rejected.
+    """
+
+    ATOMIC = 'atomic'
+    PARTIAL = 'partial'
+
+    item_errors = None
+    item_indexes = None
+    item_instances = None
+    conflicting_keys = ()
+
+    def get_bulk_option(self, name, setting, default):
+        return getattr(
+            getattr(self.child, 'Meta', None), name,
+            getattr(settings, setting, default))
+
+    @property
+    def partial_errors(self):
+        return self.get_bulk_option(
+            'bulk_errors', 'SPLINT_BULK_ERRORS', self.ATOMIC) == self.PARTIAL
+
+    @property
+    def upsert(self):
+        return bool(self.context.get('bulk_key_fields'))
+
+    def get_key_fields(self):
+        opts = self.child.Meta.model._meta
+        return [
+            opts.get_field(name)
+            for name in self.context.get('bulk_key_fields') or [opts.pk.name]
+        ]
+
+    def to_internal_value(self, data):
+        """Validate the items in one pass, keeping errors by index."""
+        if html.is_html_input(data):
+            data = html.parse_html_list(data, default=[])
+        if not isinstance(data, list):
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    self.error_messages['not_a_list'].format(
+                        input_type=type(data).__name__)]
+            }, code='not_a_list')
+        if not self.allow_empty and not data:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    self.error_messages['empty']]
+            }, code='empty')
+
+        max_items = getattr(self, 'max_length', None) or self.get_bulk_option(
+            'bulk_max_items', 'SPLINT_BULK_MAX_ITEMS', 5000)
+        if len(data) > max_items:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    f'Ensure this list has no more than {max_items} items.']
+            }, code='max_length')
+
+        self.prefetch_related_pks(data)
+        if self.instance is not None:
+            key_fields = self.get_key_fields()
+            instances = self.fetch_instances(data, key_fields)
+
+        validated, errors = [], {}
+        self.item_indexes = []
+        self.item_instances = []
+        unique_sets = {names: set() for names in self.get_unique_fields()}
+        for index, item in enumerate(data):
+            obj = None
+            # Unknown keys are checked against the item, not the whole list
+            initial_data = item
+            if self.instance is not None:
+                key = self.get_item_key(item, key_fields)
+                obj = instances.get(key)
+                if obj is None and not self.upsert:
+                    errors[index] = {key_fields[0].name: ['Not found.']}
+                    continue
+                if obj is None and key in self.conflicting_keys:
+                    errors[index] = {
+                        key_fields[0].name: ['Conflicts with existing data.']}
+                    continue
+                if not self.upsert:
+                    initial_data = {
+                        key: value for key, value in item.items()
+                        if key != key_fields[0].name
+                    }
+
+            self.child.instance = obj
+            self.child.initial_data = initial_data
+            try:
+                attrs = self.child.run_validation(item)
+            except serializers.ValidationError as exc:
+                errors[index] = exc.detail
+                continue
+
+            duplicated = self.check_unique(attrs, obj, unique_sets)
+            if duplicated:
+                errors[index] = duplicated
+                continue
+            validated.append(attrs)
+            self.item_indexes.append(index)
+            self.item_instances.append(obj)
+        self.child.instance = None
+
+        if errors and not self.partial_errors:
+            raise serializers.ValidationError(
+                [errors.get(index, {}) for index in range(len(data))])
+        self.item_errors = errors
+        return validated
+
+    def get_unique_fields(self):
+        """Tuples of field names unique (together) on the model."""
+        opts = self.child.Meta.model._meta
+        unique = [(f.name,) for f in opts.concrete_fields if f.unique]
+        unique += [tuple(names) for names in opts.unique_together]
+        unique += [
+            tuple(constraint.fields)
+            for constraint in getattr(opts, 'total_unique_constraints', ())
+        ]
+        return list(dict.fromkeys(unique))
+
+    def check_unique(self, attrs, obj, unique_sets):
+        """Errors of an item repeating unique values of a previous item.
+
+        Values missing from the item are taken from its object, if any.
+        Sets including a null value are not checked.
+        """
+        opts = self.child.Meta.model._meta
+        keys = {}
+        for names in unique_sets:
+            key = []
+            for name in names:
+                if name in attrs:
+                    value = attrs[name]
+                    if isinstance(value, models.Model):
+                        value = value.pk
+                elif obj is not None:
+                    value = getattr(obj, opts.get_field(name).attname)
+                else:
+                    value = None
+                if value is None:
+                    break
+                key.append(value)
+            else:
+                if tuple(key) in unique_sets[names]:
+                    name = names[0] if len(names) == 1 else \
+                        api_settings.NON_FIELD_ERRORS_KEY
+                    return serializers.ValidationError(
+                        {name: ['Duplicated in this list.']},
+                        code='unique').detail
+                keys[names] = tuple(key)
+
+        for names, key in keys.items():
+            unique_sets[names].add(key)
+        return None
+
+    @staticmethod
+    def get_item_key(item, key_fields):
+        try:
+            return tuple(field.to_python(item[field.name])
+                         for field in key_fields)
+        except (KeyError, TypeError, ValidationError):
+            return None
+
+    def fetch_instances(self, data, key_fields):
+        """Objects of the instance queryset matching the items, by key.
+
+        On upsert, keys of rows out of the queryset (e.g. soft deleted) are
+        kept at `conflicting_keys`, these items can't be created.
+        """
+        self.conflicting_keys = set()
+        keys = {self.get_item_key(item, key_fields) for item in data} - {None}
+        if not keys:
+            return {}
+
+        instances = {
+            tuple(getattr(obj, field.attname) for field in key_fields): obj
+            for obj in self.filter_keys(self.instance, keys, key_fields)
+        }
+        missing = keys - set(instances)
+        if self.upsert and missing:
+            manager = self.child.Meta.model._base_manager
+            self.conflicting_keys = set(
+                self.filter_keys(manager.all(), missing, key_fields)
+                .values_list(*(field.attname for field in key_fields)))
+        return instances
+
+    @staticmethod
+    def filter_keys(queryset, keys, key_fields):
+        if len(key_fields) == 1:
+            return queryset.filter(**{
+                f'{key_fields[0].name}__in': [key[0] for key in keys]})
+        return queryset.filter(reduce(operator.or_, (
+            models.Q(**{
+                field.name: value for field, value in zip(key_fields, key)})
+            for key in keys)))
+
+    def prefetch_related_pks(self, data):
+        """Resolve the primary keys of related fields with one query each."""
+        for name, field in self.child.fields.items():
+            if (type(field) is not serializers.PrimaryKeyRelatedField or
+                    field.read_only or field.pk_field is not None):
+                continue
+
+            queryset = field.get_queryset()
+            to_python = queryset.model._meta.pk.to_python
+            pks = set()
+            for item in data:
+                if isinstance(item, dict) and item.get(name) is not None:
+                    try:
+                        pks.add(to_python(item[name]))
+                    except (ValidationError, TypeError):
+                        pass
+            objs = queryset.in_bulk(pks)
+
+            def to_internal_value(value, field=field, objs=objs,
+                                  to_python=to_python):
+                try:
+                    obj = objs.get(to_python(value))
+                except (ValidationError, TypeError):
+                    obj = None
+                if obj is None:
+                    return type(field).to_internal_value(field, value)
+                return obj
+
+            field.to_internal_value = to_internal_value
+
+    def get_to_many(self, method, attrs):
+        model = self.child.Meta.model
+        serializers.raise_errors_on_nested_writes(method, self.child, attrs)
+        info = model_meta.get_field_info(model)
+        return {
+            name for name, relation in info.relations.items()
+            if relation.to_many
+        }
+
+    def create(self, validated_data):
+        """Create the items with chunked bulk_create in a transaction."""
+        indexes = self.item_indexes or list(range(len(validated_data)))
+        with transaction.atomic():
+            return self.create_items(validated_data, indexes)
+
+    def create_items(self, validated_data, indexes):
+        if not validated_data:
+            return []
+
+        model = self.child.Meta.model
+        to_many = self.get_to_many('create', validated_data[0])
+        items = []
+        for attrs, index in zip(validated_data, indexes):
+            attrs = dict(attrs)
+            relations = {
+                name: attrs.pop(name) for name in to_many if name in attrs}
+            items.append((model(**attrs), relations, index))
+
+        def write(chunk):
+            return model._default_manager.bulk_create(
+                [obj for obj, _, _ in chunk])
+
+        return self.write_chunks(items, write)
+
+    def update(self, instance, validated_data):
+        """Update the matched objects, with one bulk_update per set of
+        changed fields, and create the others (upsert)."""
+        if not validated_data:
+            return []
+
+        model = self.child.Meta.model
+        to_many = self.get_to_many('update', validated_data[0])
+        groups = {}
+        new, new_indexes = [], []
+        for obj, attrs, index in zip(
+                self.item_instances, validated_data, self.item_indexes):
+            if obj is None:
+                new.append(attrs)
+                new_indexes.append(index)
+                continue
+
+            attrs = dict(attrs)
+            relations = {
+                name: attrs.pop(name) for name in to_many if name in attrs}
+            for name, value in attrs.items():
+                setattr(obj, name, value)
+            groups.setdefault(tuple(sorted(attrs)), []).append(
+                (obj, relations, index))
+
+        written = []
+        with transaction.atomic():
+            for fields, items in groups.items():
+                def write(chunk, fields=fields):
+                    objs = [obj for obj, _, _ in chunk]
+                    if fields:
+                        model._default_manager.bulk_update(objs, fields)
+                    return objs
+
+                written += self.write_chunks(items, write)
+            written += self.create_items(new, new_indexes)
+        return written
+
+    def write_chunks(self, items, write):
+        """Write (object, relations, index) items in chunks.
+
+        In partial mode, chunks conflicting with existing data are written
+        again item by item, to report the conflicting ones.
+        """
+        if self.item_errors is None:
+            self.item_errors = {}
+        batch_size = self.get_bulk_option(
+            'bulk_batch_size', 'SPLINT_BULK_BATCH_SIZE', 500)
+
+        def write_chunk(chunk):
+            objs = write(chunk)
+            for obj, relations, _ in chunk:
+                for name, value in relations.items():
+                    getattr(obj, name).set(value)
+            return objs
+
+        written = []
+        for start in range(0, len(items), batch_size):
+            chunk = items[start:start + batch_size]
+            if not self.partial_errors:
+                try:
+                    written += write_chunk(chunk)
+                except IntegrityError:
+                    raise serializers.ValidationError({
+                        api_settings.NON_FIELD_ERRORS_KEY: [
+                            'Conflicts with existing data.']
+                    }, code='unique')
+                continue
+            try:
+                with transaction.atomic():
+                    written += write_chunk(chunk)
+            except IntegrityError:
+                for item in chunk:
+                    try:
+                        with transaction.atomic():
+                            written += write_chunk([item])
+                    except IntegrityError:
+                        self.item_errors[item[2]] = {
+                            api_settings.NON_FIELD_ERRORS_KEY: [
+                                'Conflicts with existing data.']}
+        return written
+
+
 class SplintSerializer(SplintSerializerMixin, serializers.ModelSerializer):
 
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        """Use SplintBulkListSerializer with `Meta.bulk_writes = True` or a
+        `bulk_writes` context (UpdateListMixin), unless
+        Meta.list_serializer_class is set.
+
+        Bulk writes don't call the serializer `create()`/`update()` nor the
+        models `save()`.
+        """
+        list_serializer = super().many_init(*args, **kwargs)
+        bulk_writes = getattr(getattr(cls, 'Meta', None), 'bulk_writes', False)
+        if (type(list_serializer) is serializers.ListSerializer and (
+                bulk_writes or
+                (kwargs.get('context') or {}).get('bulk_writes'))):
+            list_serializer.__class__ = SplintBulkListSerializer
+        return list_serializer
+
     def __init__(self, *args, **kwargs):
         # Don't pass the 'fields' arg up to the superclass
         fields = kwargs.pop('fields', None)
@@ -62,6 +465,20 @@ class SplintCreateListMixin:
 
         return super().get_serializer(*args, **kwargs)
 
+    def create(self, request, *args, **kwargs):
+        """Create, answering 207 with the errors of items not created."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        errors = getattr(serializer, 'item_errors', None)
+        if errors:
+            return Response(
+                {'results': serializer.data, 'errors': errors},
+                status=status.HTTP_207_MULTI_STATUS, headers=headers)
+        return Response(
+            serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+
 
 class SplintBase64ImageField(serializers.ImageField):
     """
@@ -1,8 +1,20 @@
+from itertools import islice
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import MethodNotAllowed, ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
+from django_splint.api.permissions import IsAdminUserAuthenticated
+from django_splint.api.serializers import SplintCreateListMixin
+from django_splint.utils import stats
+from django_splint.utils.decorators import prefetch_cached_properties
+
 
 class SplintViewSetMixin:
     """Mixin for creating generic methos for SplintViewsets."""
@@ -13,13 +25,21 @@ class SplintViewSetMixin:
             return self.list_serializer_class
         if (hasattr(self, 'write_serializer_class') and
                 self.action in [
-                'create', 'update', 'partial_update', 'destroy']):
+                'create', 'update', 'partial_update', 'destroy',
+                'bulk_update', 'bulk_upsert']):
             return self.write_serializer_class
         if (hasattr(self, 'read_serializer_class') and
                 self.action in ['list', 'retrieve']):
             return self.read_serializer_class
         return super().get_serializer_class()
 
+    def get_serializer(self, *args, **kwargs):
+        """Prefetch `prefetch_cached_properties` of listed objects."""
+        names = getattr(self, 'prefetch_cached_properties', None)
+        if names and args and args[0] is not None and kwargs.get('many'):
+            args = (prefetch_cached_properties(args[0], *names),) + args[1:]
+        return super().get_serializer(*args, **kwargs)
+
     def paginate_queryset(self, *args, **kwargs):
         """Remove pagination if parameter no_page is passed."""
         if 'no_page' in self.request.query_params:
@@ -37,15 +57,125 @@ class SplintViewSet(SplintViewSetMixin, GenericViewSet):
     pass
 
 
-class CreateListMixin:
+class CreateListMixin(SplintCreateListMixin):
     """Allows bulk creation of a resource."""
+    pass
 
-    def get_serializer(self, *args, **kwargs):
-        """List serialier adding many kwargs."""
-        if isinstance(kwargs.get('data', {}), list):
-            kwargs['many'] = True
 
-        return super().get_serializer(*args, **kwargs)
+class UpdateListMixin:
+    """Allows bulk update of a resource.
+
+    `bulk_update` takes a list of `{id, ...changes}`, `bulk_upsert` a list
+    of objects matched by `bulk_upsert_fields` (created when not found).
+    """
+
+    bulk_upsert_fields = None
+
+    @action(methods=['patch'], detail=False, url_path='bulk-update')
+    def bulk_update(self, request):
+        """Perform bulk update."""
+        return self.perform_bulk_write(request, partial=True)
+
+    @action(methods=['put'], detail=False, url_path='bulk-upsert')
+    def bulk_upsert(self, request):
+        """Perform bulk upsert by `bulk_upsert_fields`."""
+        if not self.bulk_upsert_fields:
+            raise MethodNotAllowed(request.method)
+        return self.perform_bulk_write(
+            request, key_fields=self.bulk_upsert_fields)
+
+    def perform_bulk_write(self, request, key_fields=None, partial=False):
+        # instance as keyword, objects are fetched by the serializer
+        serializer = self.get_serializer(
+            instance=self.get_queryset(), data=request.data, many=True,
+            partial=partial, context={
+                **self.get_serializer_context(), 'bulk_writes': True,
+                'bulk_key_fields': key_fields})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        errors = getattr(serializer, 'item_errors', None)
+        if errors:
+            return Response(
+                {'results': serializer.data, 'errors': errors},
+                status=status.HTTP_207_MULTI_STATUS)
+        return Response(serializer.data)
+
+
+class StreamListMixin:
+    """Streams unpaginated lists (`no_page`, or without pagination class).
+
+    The queryset is read in chunks of `stream_chunk_size` objects
+    (`SPLINT_STREAM_CHUNK_SIZE`, default 1000), with keyset pagination when
+    ordered by primary key, and each chunk is serialized and written out as
+    it is read, so memory does not grow with the number of rows. The
+    response is a JSON array, or NDJSON with `no_page=ndjson`.
+    """
+
+    stream_chunk_size = None
+
+    def list(self, request, *args, **kwargs):
+        """Stream the list when not paginated."""
+        if (self.paginator is not None and
+                'no_page' not in request.query_params):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        ndjson = request.query_params.get('no_page') == 'ndjson'
+        return StreamingHttpResponse(
+            self.render_stream(self.iter_stream_chunks(queryset), ndjson),
+            content_type='application/x-ndjson' if ndjson else
+            'application/json')
+
+    def get_stream_key(self, queryset):
+        """Primary key ordering of the queryset, None when ordered by
+        anything else."""
+        if (not hasattr(queryset, 'iter_chunks') or
+                not queryset.query.can_filter()):
+            return None
+
+        ordering = list(queryset.query.order_by or (
+            queryset.model._meta.ordering
+            if queryset.query.default_ordering else []))
+        pk_name = queryset.model._meta.pk.name
+        if not ordering:
+            return 'pk'
+        # Expressions (e.g. F('id').desc()) fall back to iterator()
+        if (len(ordering) == 1 and isinstance(ordering[0], str) and
+                ordering[0].lstrip('-') in ('pk', pk_name)):
+            return ordering[0]
+        return None
+
+    def iter_stream_chunks(self, queryset):
+        size = self.stream_chunk_size or getattr(
+            settings, 'SPLINT_STREAM_CHUNK_SIZE', 1000)
+        key = self.get_stream_key(queryset)
+        if key is not None:
+            yield from queryset.iter_chunks(size, key=key)
+            return
+
+        objs = queryset.iterator(chunk_size=size)
+        while True:
+            chunk = list(islice(objs, size))
+            if not chunk:
+                return
+            yield chunk
+
+    def render_stream(self, chunks, ndjson=False):
+        renderer = JSONRenderer()
+        if not ndjson:
+            yield b'['
+        first = True
+        for chunk in chunks:
+            data = self.get_serializer(chunk, many=True).data
+            if ndjson:
+                yield b''.join(renderer.render(item) + b'\n' for item in data)
+                continue
+            rendered = renderer.render(data)[1:-1]
+            if rendered:
+                yield rendered if first else b',' + rendered
+                first = False
+        if not ndjson:
+            yield b']'
 
 
 class DestroyListMixin:
@@ -57,3 +187,29 @@ class DestroyListMixin:
         queryset = self.get_queryset()
         queryset.filter(id__in=request.data).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SplintCacheStatsView(APIView):
+    """Report of the cache decorators stats of every process (admins only).
+
+    Query params: `top` (default 20), `sort` (event or derived column,
+    default 'misses') and `output=prometheus` for the Prometheus text format.
+    """
+
+    permission_classes = [IsAdminUserAuthenticated]
+
+    def get(self, request):
+        """Publish the stats of this process and report them all."""
+        stats.publish()
+        data = stats.collect()
+        if request.query_params.get('output') == 'prometheus':
+            return HttpResponse(
+                stats.prometheus_text(data),
+                content_type='text/plain; version=0.0.4')
+
+        try:
+            top = int(request.query_params.get('top', 20))
+        except ValueError:
+            raise ValidationError({'top': 'A valid integer is required.'})
+        return Response(stats.report(
+            data, top=top, sort=request.query_params.get('sort', 'misses')))
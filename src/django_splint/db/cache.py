@@ -0,0 +1,189 @@
+import contextvars
+import hashlib
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+KEY_PREFIX = 'splint:row:v1'
+DEFAULT_TIMEOUT = 60 * 5
+
+_identity_map = contextvars.ContextVar('splint_identity_map', default=None)
+
+
+def get_row_cache():
+    """Cache backend of the row cache (`SPLINT_ROW_CACHE_ALIAS`)."""
+    return caches[getattr(settings, 'SPLINT_ROW_CACHE_ALIAS', 'default')]
+
+
+@lru_cache(maxsize=None)
+def cached_lookup_fields(model):
+    """Fields cached lookups are keyed by, empty when disabled.
+
+    Enabled by `Meta.cache_lookups`, True for primary key lookups or an
+    iterable of unique field names also cached.
+    """
+    option = getattr(model._meta, 'cache_lookups', None)
+    if not option:
+        return ()
+
+    fields = [model._meta.pk.name]
+    if option is not True:
+        fields += [f for f in option if f not in fields]
+    return tuple(fields)
+
+
+def get_lookup_timeout(model):
+    """Timeout of cached rows, from `Meta.cache_lookup_timeout`."""
+    timeout = getattr(model._meta, 'cache_lookup_timeout', None)
+    return DEFAULT_TIMEOUT if timeout is None else timeout
+
+
+def row_cache_key(model, field, value):
+    """Cache key of a row (primary key) or of a unique value pointer."""
+    if field != model._meta.pk.name:
+        value = hashlib.md5(str(value).encode()).hexdigest()
+    return f'{KEY_PREFIX}:{model._meta.label_lower}:{field}:{value}'
+
+
+@contextmanager
+def identity_map():
+    """Share instances fetched by cached lookups inside the block."""
+    token = _identity_map.set({})
+    try:
+        yield
+    finally:
+        _identity_map.reset(token)
+
+
+def _dump(obj):
+    """Cached representation of a row: loaded field values."""
+    attnames = [
+        f.attname for f in obj._meta.concrete_fields
+        if f.attname in obj.__dict__
+    ]
+    return obj._state.db, attnames, [obj.__dict__[a] for a in attnames]
+
+
+def _load(model, data):
+    db, attnames, values = data
+    return model.from_db(db, attnames, values)
+
+
+def cache_rows(objs):
+    """Write rows (and their unique value pointers) to the cache."""
+    if not objs:
+        return
+
+    model = type(objs[0])
+    pk_name = model._meta.pk.name
+    values = {}
+    for obj in objs:
+        values[row_cache_key(model, pk_name, obj.pk)] = _dump(obj)
+        for field in cached_lookup_fields(model)[1:]:
+            values[row_cache_key(
+                model, field, getattr(obj, field))] = obj.pk
+
+    get_row_cache().set_many(values, timeout=get_lookup_timeout(model))
+
+
+def get_cached_rows(manager, field, values):
+    """Rows by field value, read through the cache, as {value: obj}.
+
+    Values are converted with the field `to_python` first (e.g. '1' to 1
+    for integer keys) and the result is keyed by the converted values.
+    """
+    model = manager.model
+    to_python = model._meta.get_field(field).to_python
+    values = [to_python(value) for value in values]
+    pk_name = model._meta.pk.name
+    identity = _identity_map.get()
+    cache = get_row_cache()
+
+    keys = {row_cache_key(model, field, value): value for value in values}
+    found = {}
+    if identity is not None:
+        found = {
+            keys[key]: identity[key] for key in keys if key in identity}
+
+    missing = {key: value for key, value in keys.items()
+               if value not in found}
+    if missing:
+        cached = cache.get_many(list(missing))
+        if field == pk_name:
+            rows = {key: missing[key] for key in cached}
+        else:
+            rows = {
+                row_cache_key(model, pk_name, pk): missing[key]
+                for key, pk in cached.items()
+            }
+            if identity is not None:
+                found.update(
+                    (value, identity[key]) for key, value in rows.items()
+                    if key in identity)
+            cached = cache.get_many(
+                [key for key, value in rows.items() if value not in found])
+
+        for key, data in cached.items():
+            value = rows[key]
+            obj = _load(model, data)
+            if field == pk_name or getattr(obj, field) == value:
+                found[value] = obj
+
+    fetch = [value for value in values if value not in found]
+    if fetch:
+        fetched = list(manager.filter(**{f'{field}__in': fetch}))
+        # Rows read inside a transaction may be rolled back.
+        if not transaction.get_connection(manager.db).in_atomic_block:
+            cache_rows(fetched)
+        found.update((getattr(obj, field), obj) for obj in fetched)
+
+    if identity is not None:
+        for key, value in keys.items():
+            if value in found:
+                obj = identity[key] = found[value]
+                identity.setdefault(
+                    row_cache_key(model, pk_name, obj.pk), obj)
+    return found
+
+
+def invalidate_rows(model, objs=(), pks=(), using=None):
+    """Remove rows from the cache, now and when the transaction commits.
+
+    Unique value pointers are removed for objects, for the current and the
+    original (loaded) values.
+    """
+    fields = cached_lookup_fields(model)
+    if not fields:
+        return
+
+    pk_name = fields[0]
+    keys = {row_cache_key(model, pk_name, pk) for pk in pks}
+    for obj in objs:
+        if obj.pk is not None:
+            keys.add(row_cache_key(model, pk_name, obj.pk))
+        get_state = getattr(obj, 'get_original_state', None)
+        original = (get_state() if get_state else None) or {}
+        for field in fields[1:]:
+            attname = model._meta.get_field(field).attname
+            keys.add(row_cache_key(model, field, obj.__dict__.get(attname)))
+            if attname in original:
+                keys.add(row_cache_key(model, field, original[attname]))
+
+    def delete():
+        get_row_cache().delete_many(list(keys))
+        identity = _identity_map.get()
+        if identity is not None:
+            for key in keys:
+                identity.pop(key, None)
+
+    delete()
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(delete, using=using)
+
+
+def invalidate_on_signal(sender, instance, **kwargs):
+    """post_save/post_delete receiver for models out of SplintModel."""
+    invalidate_rows(sender, objs=[instance], using=instance._state.db)
@@ -1,13 +1,71 @@
+import hashlib
 import re
-from tempfile import NamedTemporaryFile
+from io import BytesIO
 from PIL import Image
 
 from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db.models import ImageField
+from django.db.models.fields.files import ImageFieldFile
+from django.db.models.signals import post_save
+
+from django_splint.db.images import ASYNC, schedule_pending_images
 
 WITH = 768
 HEIGHT = 573
 
+SIGNATURE_PATTERN = re.compile(r'_sp([0-9a-f]{8})')
+
+# Reduce by integer factors (box filter) while the image is at least
+# REDUCING_GAP times the target size, before the final LANCZOS resample.
+REDUCING_GAP = 2.0
+
+# Pillow format: (mode, extension)
+FORMATS = {
+    'JPEG': ('RGB', 'jpe'),
+    'PNG': ('P', 'png'),
+    'WEBP': ('RGB', 'webp'),
+}
+
+
+class SplintImageFieldFile(ImageFieldFile):
+
+    @property
+    def pending(self):
+        """Whether the image still waits for (async) processing."""
+        return bool(self) and not self.field.is_processed(self)
+
+    def rendition_name(self, key):
+        """Storage name of a rendition of the image."""
+        return self.field.rendition_name(self.name, key)
+
+    @property
+    def renditions(self):
+        """Rendition urls as {key: url}, empty while the image is pending."""
+        if not self or self.pending:
+            return {}
+        return {
+            key: self.storage.url(self.rendition_name(key))
+            for key in self.field.renditions
+        }
+
+    @property
+    def srcset(self):
+        """`srcset` attribute with the image and its renditions.
+
+        Candidates are described by their declared width.
+        """
+        if not self or self.pending:
+            return ''
+        candidates = [(self.field.width, self.url)] + [
+            (options.get('width'), self.storage.url(self.rendition_name(key)))
+            for key, options in self.field.renditions.items()
+        ]
+        return ', '.join(
+            f'{url} {width}w' for width, url in sorted(
+                c for c in candidates if c[0]))
+
 
 class SplintImageField(ImageField):
     """SplintImageField.
@@ -17,21 +75,66 @@ class SplintImageField(ImageField):
 
     Vertical crop will be applied before resizing the image.
 
+    Processed files are named with a signature of the processing settings
+    (`{name}_sp{signature}.{ext}`), so saving a model with an already
+    processed image does not touch the storage.
+
+    With `processing='async'` (default from `SPLINT_IMAGE_PROCESSING`) the
+    original file is stored as is and left pending; it is processed by the
+    `SPLINT_IMAGE_BACKEND` worker once the transaction commits.
+
+    `renditions` describes other sizes and formats rendered from the same
+    decoded image, as {key: {'width', 'height', 'quality', 'format'}}. They
+    are stored next to the image as `{name}_{key}.{ext}`.
+
+    Images larger than `max_pixels` (default `SPLINT_IMAGE_MAX_PIXELS`) are
+    rejected with a ValidationError before being decoded.
+
     Usage: thumbnail = SplintImageField(
         'Thumbnail', upload_to='track', null=True, blank=True, width=120)
     """
 
+    attr_class = SplintImageFieldFile
+
     def __init__(
-        self, *args, quality=80, width=WITH, vertical_crop=None, height=None, **kwargs
+        self, *args, quality=80, width=WITH, vertical_crop=None, height=None,
+        processing=None, renditions=None, max_pixels=None, **kwargs
     ):
         """Override init to add quality and width, height information"""
         self.quality = quality
         self.width = width
         self.height = height
         self.vertical_crop = vertical_crop
+        self.processing = processing
+        self.renditions = renditions or {}
+        self.max_pixels = max_pixels
 
         super().__init__(*args, **kwargs)
 
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        post_save.connect(schedule_pending_images, sender=cls)
+
+    def validate(self, value, model_instance):
+        super().validate(value, model_instance)
+        if value and not value._committed:
+            self.check_pixels(Image.open(value.file))
+            value.file.seek(0)
+
+    def check_pixels(self, im):
+        """Reject images over the pixel limit, only reading the header."""
+        max_pixels = self.max_pixels or getattr(
+            settings, 'SPLINT_IMAGE_MAX_PIXELS', None)
+        if max_pixels and im.width * im.height > max_pixels:
+            raise ValidationError(
+                f'Image of {im.width}x{im.height} pixels exceeds the limit '
+                f'of {max_pixels} pixels.', code='max_pixels')
+
+    def get_processing(self):
+        """Processing mode of the field, 'sync' or 'async'."""
+        return self.processing or getattr(
+            settings, 'SPLINT_IMAGE_PROCESSING', 'sync')
+
     def pre_save(self, model_instance, add):
         """Optmize image saved.
 
@@ -41,59 +144,138 @@ class SplintImageField(ImageField):
         # file = super().pre_save(model_instance, add)
         file = getattr(model_instance, self.attname)
 
-        if file and bool(file.name):
-            try:
-                opened_image = file.file
-                opened_image.open()
-            except (OSError, IOError, ClientError):
-                return file
-
-            im = Image.open(opened_image)
-
-            if not file._committed or self.width != im.width:
-                if im.format == "PNG":
-                    CONVERT = "P"
-                    FORMAT = "PNG"
-                    EXTENSION = "png"
-                else:
-                    CONVERT = "RGB"
-                    FORMAT = "JPEG"
-                    EXTENSION = "jpe"
-                assert self.width or self.height
-                width, height = self.width, self.height
-
-                im = self.crop_image(im)
-
-                if width is None:
-                    width = int(im.width * height / im.height)
-                if height is None:
-                    height = int(im.height * width / im.width)
-
-                width = min(width, im.width)
-                height = min(height, im.height)
-                im = im.resize((width, height), Image.ANTIALIAS)
-
-                with NamedTemporaryFile() as temp_file:
-                    # Force image convertion to JPEG
-                    im = im.convert(CONVERT)
-                    im.save(temp_file, quality=self.quality, format=FORMAT)
-                    file.save(
-                        f'{re.split("[_.]+", file.name)[0].rsplit("/", 1)[-1]}.{EXTENSION}',
-                        temp_file,
-                        save=False,
-                    )
+        if file and bool(file.name) and not (
+                file._committed and self.is_processed(file)):
+            if self.get_processing() == ASYNC:
+                if not file._committed:
+                    self.check_pixels(Image.open(file.file))
+                    file.file.seek(0)
+                    file.save(file.name, file.file, save=False)
+                model_instance.__dict__.setdefault(
+                    '_pending_images', set()).add(self.name)
+            else:
+                self.process(file)
 
         return file
 
+    def process(self, file):
+        """Resize the image (and its renditions) from a single decode.
+
+        JPEG sources are decoded at the smallest DCT scale still larger than
+        the targets (draft mode), then reduced and resampled with LANCZOS
+        once to the largest target. Every output is derived from that
+        intermediate image and encoded in memory.
+        """
+        try:
+            opened_image = file.file
+            opened_image.open()
+        except (OSError, IOError, ClientError):
+            return
+
+        im = Image.open(opened_image)
+        self.check_pixels(im)
+        FORMAT = "PNG" if im.format == "PNG" else "JPEG"
+        assert self.width or self.height
+
+        box = self.get_crop_box(im.size)
+        cropped = (box[2] - box[0], box[3] - box[1])
+        sizes = {None: self.get_size(cropped, self.width, self.height)}
+        for key, options in self.renditions.items():
+            sizes[key] = self.get_size(
+                cropped, options.get('width'), options.get('height'))
+        largest = max(sizes.values(), key=lambda size: size[0] * size[1])
+
+        if im.format == 'JPEG':
+            source_width, source_height = im.size
+            im.draft(im.mode, (
+                -(-im.width * largest[0] // cropped[0]),
+                -(-im.height * largest[1] // cropped[1]),
+            ))
+            # Draft rounds each axis on its own
+            scale_x = im.width / source_width
+            scale_y = im.height / source_height
+            box = (
+                box[0] * scale_x, box[1] * scale_y,
+                min(box[2] * scale_x, im.width),
+                min(box[3] * scale_y, im.height),
+            )
+
+        im = im.resize(
+            largest, Image.LANCZOS, box=box, reducing_gap=REDUCING_GAP)
+
+        name = (f'{re.split("[_.]+", file.name)[0].rsplit("/", 1)[-1]}'
+                f'_sp{self.get_signature()}.{FORMATS[FORMAT][1]}')
+        file.save(
+            name, self.encode(self.resize(im, sizes[None]), FORMAT,
+                              self.quality), save=False)
+
+        for key, options in self.renditions.items():
+            rendition_name = self.rendition_name(file.name, key)
+            if file.storage.exists(rendition_name):
+                file.storage.delete(rendition_name)
+            file.storage.save(rendition_name, self.encode(
+                self.resize(im, sizes[key]),
+                options.get('format', FORMAT).upper(),
+                options.get('quality', self.quality)))
+
+    def get_size(self, size, width, height):
+        """Target size keeping the aspect ratio, never upscaling."""
+        if width is None:
+            width = int(size[0] * height / size[1])
+        if height is None:
+            height = int(size[1] * width / size[0])
+
+        return min(width, size[0]), min(height, size[1])
+
+    def resize(self, im, size):
+        if size == im.size:
+            return im
+        return im.resize(size, Image.LANCZOS, reducing_gap=REDUCING_GAP)
+
+    def encode(self, im, format, quality):
+        """Encode an image in memory."""
+        content = BytesIO()
+        # Force image convertion to the output format mode
+        im = im.convert(FORMATS[format][0])
+        im.save(content, quality=quality, format=format)
+        content.seek(0)
+        return content
+
+    def rendition_name(self, name, key):
+        """Storage name of a rendition, derived from the image name."""
+        options = self.renditions[key]
+        stem, extension = name.rsplit('.', 1)
+        if 'format' in options:
+            extension = FORMATS[options['format'].upper()][1]
+        return f'{stem}_{key}.{extension}'
+
+    def get_signature(self):
+        """Short hash of the processing settings (size, quality and crop)."""
+        settings = f'{self.width}:{self.height}:{self.quality}:{self.vertical_crop}'
+        if self.renditions:
+            settings += f':{sorted(self.renditions.items())}'
+        return hashlib.md5(settings.encode()).hexdigest()[:8]
+
+    def is_processed(self, file):
+        """Whether the file name has the signature of current settings."""
+        return self.has_signature(file.name)
+
+    def has_signature(self, name):
+        match = SIGNATURE_PATTERN.search(name.rsplit('/', 1)[-1])
+        return bool(match) and match.group(1) == self.get_signature()
+
+    def get_crop_box(self, size):
+        """Box of the vertical crop applied before resizing the image."""
+        width, height = size
+        if self.vertical_crop and self.vertical_crop * 2 < height:
+            return (
+                0,
+                self.vertical_crop,
+                width - 1,
+                height - self.vertical_crop - 1,
+            )
+        return 0, 0, width, height
+
     def crop_image(self, im):
         """Crop will be applied before resizing the image."""
-        if self.vertical_crop and self.vertical_crop * 2 < im.height:
-            im = im.crop(
-                (
-                    0,
-                    self.vertical_crop,
-                    im.width - 1,
-                    im.height - self.vertical_crop - 1,
-                )
-            )
-        return im
+        return im.crop(self.get_crop_box(im.size))
@@ -0,0 +1,337 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from django_splint.db.cache import invalidate_rows
+from django_splint.task import SplintTask
+
+logger = logging.getLogger(__name__)
+
+SYNC = 'sync'
+ASYNC = 'async'
+
+PROCESSED = 'processed'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+CHECKPOINT_KEY = 'splint:rerender:{}'
+
+DEFAULT_BACKEND = 'django_splint.db.images.ProcessPoolImageBackend'
+
+
+def get_process_pool(max_workers):
+    """Pool of spawned processes with Django set up."""
+    return ProcessPoolExecutor(
+        max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def process_pending_image(label, pk, field_name):
+    """Process a pending image of a row and store the processed name.
+
+    Only the image column is updated, and only when the row still points to
+    the pending file, then the original file is removed from the storage.
+    Returns the outcome: 'processed', 'skipped' or 'failed'.
+    """
+    model = apps.get_model(label)
+    obj = model._base_manager.filter(pk=pk).first()
+    if obj is None:
+        return SKIPPED
+
+    field = model._meta.get_field(field_name)
+    file = getattr(obj, field.attname)
+    if not file or field.is_processed(file):
+        return SKIPPED
+
+    original = file.name
+    field.process(file)
+    if file.name == original:
+        return FAILED
+
+    updated = model._base_manager.filter(
+        pk=pk, **{field.attname: original}).update(**{field.attname: file.name})
+    file.storage.delete(original if updated else file.name)
+    invalidate_rows(model, pks=[pk])
+    return PROCESSED if updated else SKIPPED
+
+
+class LocalImageBackend:
+    """Process images in the current process (tests, development)."""
+
+    def enqueue(self, label, pk, field_name):
+        process_pending_image(label, pk, field_name)
+
+
+class ProcessPoolImageBackend:
+    """Process images in a pool of (spawned) worker processes."""
+
+    def __init__(self, max_workers=2):
+        """Constructor."""
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, label, pk, field_name):
+        future = self._get_executor().submit(
+            process_pending_image, label, pk, field_name)
+        future.add_done_callback(self._log_failure)
+
+    def _get_executor(self):
+        """Start the pool (again, after a fork)."""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = get_process_pool(self.max_workers)
+        return self._executor
+
+    @staticmethod
+    def _log_failure(future):
+        if future.exception() is not None:
+            logger.error('Image processing failed.', exc_info=future.exception())
+
+
+class SQSImageBackend:
+    """Send pending images to an AWS SQS queue.
+
+    The queue consumer should call `handle_image_message` with each message
+    body.
+    """
+
+    def __init__(self, queue_url):
+        """Constructor."""
+        self.queue_url = queue_url
+
+    def enqueue(self, label, pk, field_name):
+        from django_splint.utils.aws.sqs import AWSSQSHandler
+
+        AWSSQSHandler().send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(
+                {'model': label, 'pk': pk, 'field': field_name}),
+        )
+
+
+def handle_image_message(body):
+    """Process the pending image of a SQSImageBackend message."""
+    message = json.loads(body)
+    return process_pending_image(
+        message['model'], message['pk'], message['field'])
+
+
+class ProcessImageTask(SplintTask):
+    """Process a pending image on ECS.
+
+    Usage: ProcessImageTask().run_task('app_label.Model', pk, 'field')
+    """
+
+    def run(self, label, pk, field_name):
+        """Execute task."""
+        return process_pending_image(label, pk, field_name)
+
+
+class TaskImageBackend:
+    """Run a ProcessImageTask on ECS for each pending image."""
+
+    def enqueue(self, label, pk, field_name):
+        ProcessImageTask().run_task(label, pk, field_name)
+
+
+def get_image_fields(model):
+    """SplintImageFields of a model."""
+    from django_splint.db.fields import SplintImageField
+
+    return [
+        field for field in model._meta.concrete_fields
+        if isinstance(field, SplintImageField)
+    ]
+
+
+def get_image_models(labels=None):
+    """Models with SplintImageFields (or the given model labels)."""
+    models = [apps.get_model(label) for label in labels] if labels else [
+        model for model in apps.get_models() if get_image_fields(model)]
+    return [model for model in models if not model._meta.proxy]
+
+
+def rerender_chunk(label, pks, field_names):
+    """Process the images of a chunk of rows, returns outcome counts."""
+    stats = {PROCESSED: 0, SKIPPED: 0, FAILED: 0}
+    for pk in pks:
+        for field_name in field_names:
+            try:
+                outcome = process_pending_image(label, pk, field_name)
+            except Exception:
+                logger.exception(
+                    'Image processing of %s %s.%s failed.',
+                    label, pk, field_name)
+                outcome = FAILED
+            stats[outcome] += 1
+    return stats
+
+
+class SplintImageRerenderer:
+    """Process the images not processed with the current field settings.
+
+    Rows (including soft deleted ones) are scanned in primary key order and
+    chunks with pending images are processed across a pool of `workers`
+    processes (in the current process when 0). Images already processed are
+    skipped from their names, without touching the storage. The last primary
+    key of completed chunks is kept in cache, so an interrupted run resumes
+    from it.
+    """
+
+    def __init__(self, model, field_names=None, chunk_size=None,
+                 workers=None, resume=True):
+        """Constructor."""
+        self.model = model
+        self.fields = [
+            field for field in get_image_fields(model)
+            if not field_names or field.name in field_names
+        ]
+        self.chunk_size = chunk_size or getattr(
+            settings, 'SPLINT_RERENDER_CHUNK_SIZE', 100)
+        self.workers = getattr(
+            settings, 'SPLINT_RERENDER_WORKERS', os.cpu_count()
+        ) if workers is None else workers
+        self.resume = resume
+        self.checkpoint_key = CHECKPOINT_KEY.format(model._meta.label_lower)
+
+    def reset(self):
+        """Forget the checkpoint of a previous run."""
+        cache.delete(self.checkpoint_key)
+
+    def iter_chunks(self, last_pk=None):
+        """Chunks as (last scanned pk, pks with pending images, images)."""
+        attnames = [field.attname for field in self.fields]
+        queryset = self.model._base_manager.order_by('pk').values_list(
+            'pk', *attnames)
+
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(
+                pk__gt=last_pk)
+            rows = list(chunk[:self.chunk_size])
+            if not rows:
+                break
+
+            last_pk = rows[-1][0]
+            yield last_pk, [
+                row[0] for row in rows if any(
+                    name and not field.has_signature(name)
+                    for field, name in zip(self.fields, row[1:]))
+            ], len(rows) * len(self.fields)
+
+    def run(self, progress=None):
+        """Run the re-rendition, returns its stats."""
+        last_pk = cache.get(self.checkpoint_key) if self.resume else None
+        stats = {
+            'model': self.model._meta.label,
+            PROCESSED: 0,
+            SKIPPED: 0,
+            FAILED: 0,
+            'resumed_from': last_pk,
+            'elapsed': 0,
+            'images_per_second': 0,
+        }
+        if not self.fields:
+            return stats
+
+        label = self.model._meta.label
+        field_names = [field.name for field in self.fields]
+        start = time.perf_counter()
+
+        def complete(chunk_last_pk, chunk_stats):
+            for outcome, count in chunk_stats.items():
+                stats[outcome] += count
+            cache.set(self.checkpoint_key, chunk_last_pk, timeout=None)
+            if progress:
+                progress(stats)
+
+        if self.workers:
+            pool = get_process_pool(self.workers)
+        running = deque()
+        try:
+            for chunk_last_pk, pks, scanned in self.iter_chunks(last_pk):
+                stats[SKIPPED] += scanned - len(pks) * len(field_names)
+                if not self.workers:
+                    complete(chunk_last_pk, rerender_chunk(
+                        label, pks, field_names))
+                    continue
+
+                running.append((chunk_last_pk, pool.submit(
+                    rerender_chunk, label, pks, field_names)))
+                # Chunks complete in order, keeping the checkpoint contiguous
+                while len(running) > self.workers * 2:
+                    chunk_last_pk, future = running.popleft()
+                    complete(chunk_last_pk, future.result())
+
+            while running:
+                chunk_last_pk, future = running.popleft()
+                complete(chunk_last_pk, future.result())
+        finally:
+            for _, future in running:
+                future.cancel()
+            if self.workers:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - start
+        stats['elapsed'] = elapsed
+        stats['images_per_second'] = (
+            stats[PROCESSED] / elapsed if elapsed else 0)
+        self.reset()
+        return stats
+
+
+class RerenderImagesTask(SplintTask):
+    """Process the images of a model on ECS.
+
+    Usage: RerenderImagesTask().run_task('app_label.Model', 'field', ...)
+    """
+
+    def run(self, label, *field_names):
+        """Execute task."""
+        return SplintImageRerenderer(
+            apps.get_model(label), field_names=field_names).run()
+
+
+_backend = None
+
+
+def get_image_backend():
+    """Backend configured at `SPLINT_IMAGE_BACKEND`."""
+    global _backend
+    if _backend is None:
+        backend_class = import_string(getattr(
+            settings, 'SPLINT_IMAGE_BACKEND', DEFAULT_BACKEND))
+        _backend = backend_class(**getattr(
+            settings, 'SPLINT_IMAGE_BACKEND_OPTIONS', {}))
+    return _backend
+
+
+def schedule_pending_images(sender, instance, **kwargs):
+    """post_save receiver enqueuing the images left pending by pre_save."""
+    pending = instance.__dict__.pop('_pending_images', None)
+    if not pending:
+        return
+
+    label, pk = sender._meta.label, instance.pk
+    for field_name in pending:
+        transaction.on_commit(
+            lambda field_name=field_name: get_image_backend().enqueue(
+                label, pk, field_name),
+            using=instance._state.db,
+        )
@@ -1,21 +1,568 @@
-import logging
+import contextvars
+import hashlib
+import operator
 import uuid
+from collections import defaultdict, namedtuple
+from copy import deepcopy
 from datetime import datetime
+from functools import lru_cache, reduce
 
+import django
 import django.db.models.options as options
 from django.contrib.auth.models import UserManager
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
-from django.db.models.query import QuerySet
-from django.forms.models import model_to_dict
+from django.db.models import Q
+from django.db.models.deletion import Collector
+from django.db.models.fields.files import FieldFile
+from django.db.models.query import (
+    FlatValuesListIterable, QuerySet, ValuesIterable)
+from django.db.models.signals import class_prepared, post_delete, post_save
 from django.utils import timezone
 
-CUSTOM_META_FIELDS = ('original_value_fields',)
+from django_splint.activity import activity_record, log_activities
+from django_splint.db.cache import (
+    cached_lookup_fields, get_cached_rows, invalidate_on_signal,
+    invalidate_rows)
+from django_splint.utils.cache import touch_model
+
+CUSTOM_META_FIELDS = (
+    'original_value_fields', 'soft_delete_per_object', 'track_changes',
+    'deleted_retention', 'lookup_fields', 'cache_lookups',
+    'cache_lookup_timeout')
 options.DEFAULT_NAMES = options.DEFAULT_NAMES + CUSTOM_META_FIELDS
 
-logger = logging.getLogger('activity')
+DELETE_CHUNK_SIZE = 1000
+
+MUTABLE_FIELD_TYPES = ('JSONField', 'ArrayField', 'HStoreField')
+
+_NOT_LOADED = object()
+
+# Set while objects are loaded from DB, their snapshot is taken by from_db.
+_loading = contextvars.ContextVar('splint_loading', default=False)
+
+TrackedFields = namedtuple(
+    'TrackedFields',
+    ('fields', 'mutable', 'always_saved', 'snapshot', 'original'))
+
+
+def soft_delete_timestamp():
+    """Timestamp saved at `_deleted_at` when an object is soft deleted."""
+    return datetime.utcnow().replace(tzinfo=timezone.get_current_timezone())
+
+
+@lru_cache(maxsize=None)
+def activity_fields(model):
+    """Concrete editable fields logged on activity records."""
+    exclude = getattr(model, 'exclude_log', None) or ()
+    return tuple(
+        f for f in model._meta.concrete_fields
+        if f.editable and f.name not in exclude)
+
+
+@lru_cache(maxsize=None)
+def tracked_fields(model):
+    """Fields tracked for changes, precomputed once per model.
+
+    Holds the concrete fields, the attnames of fields holding mutable values
+    (copied on snapshot), the names of fields that are always saved with any
+    change because their `pre_save` updates the value and whether objects
+    loaded from DB are snapshot at all (change tracking or
+    `original_value_fields`) and the `original_value_fields`, snapshot when
+    unsaved objects are created.
+    """
+    opts = model._meta
+    fields = tuple(f for f in opts.concrete_fields if not f.primary_key)
+    mutable = frozenset(
+        f.attname for f in fields
+        if f.get_internal_type() in MUTABLE_FIELD_TYPES)
+    always_saved = tuple(
+        f.name for f in fields
+        if getattr(f, 'auto_now', False) or isinstance(f, models.FileField))
+    snapshot = bool(
+        getattr(opts, 'track_changes', True) or
+        getattr(opts, 'original_value_fields', ()))
+    original = tuple(
+        opts.get_field(name)
+        for name in getattr(opts, 'original_value_fields', ()))
+    return TrackedFields(fields, mutable, always_saved, snapshot, original)
+
+
+class SplintCachedLookupMixin:
+    """Read-through cached lookups, enabled by `Meta.cache_lookups`.
+
+    Rows are cached by primary key (and by the unique fields listed at
+    `Meta.cache_lookups`) and invalidated when saved or deleted. Inside
+    `django_splint.db.cache.identity_map()` (or the
+    SplintIdentityMapMiddleware) the same instance is returned for the same
+    row.
+    """
+
+    def get_cached(self, **kwargs):
+        """Get object through the cache or return None."""
+        if len(kwargs) != 1:
+            return self.get_or_none(**kwargs)
+
+        (field, value), = kwargs.items()
+        field = self._get_cached_field(field)
+        if field is None:
+            return self.get_or_none(**kwargs)
+
+        value = self.model._meta.get_field(field).to_python(value)
+        return get_cached_rows(self, field, [value]).get(value)
+
+    def get_many(self, values, field='pk'):
+        """Objects by field values through the cache, as {value: obj}."""
+        values = list(values)
+        cached_field = self._get_cached_field(field)
+        if cached_field is None:
+            return {
+                getattr(obj, field): obj
+                for obj in self.filter(**{f'{field}__in': values})
+            }
+        return get_cached_rows(self, cached_field, values)
+
+    def _get_cached_field(self, field):
+        """Cached lookup field name or None when not cached."""
+        fields = cached_lookup_fields(self.model)
+        if fields and field in ('pk', self.model._meta.pk.attname):
+            return fields[0]
+        return field if field in fields else None
+
+
+class SplintQuerySet(QuerySet):
+    def delete(self, per_object=None, chunk_size=DELETE_CHUNK_SIZE,
+               log_activity=True, cascade=False):
+        """
+        Overriding of the delete method.
+
+        Objects are soft deleted with chunked UPDATE statements, so we
+        garantee that any object will not be completely deleted without
+        calling `save()` per row. One activity record is logged per affected
+        row.
 
+        Use `per_object=True` (or `Meta.soft_delete_per_object = True`) to
+        call `obj.delete()` for every object, for models that rely on
+        `save()` hooks.
+
+        With `cascade=True` related SplintModel rows that would be deleted
+        on cascade are soft deleted too, with the same `_deleted_at`.
+
+        Returns the number of soft deleted objects.
+        """
+        if per_object is None:
+            per_object = getattr(
+                self.model._meta, 'soft_delete_per_object', False)
+
+        if not self.query.can_filter():
+            # Sliced querysets can not be paginated by key.
+            pks = [
+                pk for pk, deleted in self.values_list('pk', '_deleted')
+                if not deleted
+            ]
+            chunks = [pks[i:i + chunk_size]
+                      for i in range(0, len(pks), chunk_size)]
+        else:
+            chunks = self.filter(_deleted=False).values_list(
+                'pk', flat=True).iter_chunks(chunk_size, key='pk')
+
+        if per_object:
+            count = 0
+            for chunk in chunks:
+                for obj in self.model._base_manager.using(self.db).filter(
+                        pk__in=chunk):
+                    obj.delete(cascade=cascade)
+                    count += 1
+            return count
+
+        deleted_at = soft_delete_timestamp()
+        return sum(
+            self._soft_delete_pks(
+                chunk, chunk_size=chunk_size, log_activity=log_activity,
+                cascade=cascade, deleted_at=deleted_at)
+            for chunk in chunks)
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, log_activity=True, **kwargs):
+        """Bulk create objects, logging one activity record per object.
+
+        `created_at`/`updated_at` are set by the fields `pre_save` and the
+        created objects are snapshot to track their changes.
+        """
+        objs = super().bulk_create(objs, *args, **kwargs)
+        touch_model(self.model, using=self.db)
+        self._after_bulk_write(objs, SplintModel.CREATED, log_activity)
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None, log_activity=True):
+        """Bulk update fields of objects, logging their changes.
+
+        `updated_at` is always updated. Objects loaded from DB without
+        changes in `fields` are skipped.
+        """
+        opts = self.model._meta
+        fields = [f for f in fields if f != 'updated_at']
+        names = {opts.get_field(f).name for f in fields}
+        now = timezone.now()
+
+        changed, changes = [], []
+        for obj in objs:
+            obj_changes = obj.get_changes()
+            if obj_changes is not None:
+                obj_changes = {
+                    name: values for name, values in obj_changes.items()
+                    if name in names
+                }
+                if not obj_changes:
+                    continue
+            obj.updated_at = now
+            changed.append(obj)
+            changes.append(obj_changes)
+
+        if not changed:
+            return 0
+
+        count = super().bulk_update(
+            changed, [*fields, 'updated_at'], batch_size=batch_size)
+        invalidate_rows(self.model, objs=changed, using=self.db)
+        touch_model(
+            self.model, fields=None if '_deleted' in names else fields,
+            using=self.db)
+        self._after_bulk_write(
+            changed, SplintModel.UPDATED, log_activity, changes=changes,
+            fields=[*fields, 'updated_at'])
+        return count
+
+    bulk_update.alters_data = True
+
+    def bulk_upsert(self, objs, unique_fields, update_fields,
+                    batch_size=None, log_activity=True):
+        """Insert objects or update the existing ones by `unique_fields`.
+
+        Uses INSERT ... ON CONFLICT on Django >= 4.1 (logged as 'upserted'),
+        otherwise looks up the existing rows, then bulk creates and bulk
+        updates. Soft deleted rows matching a key are restored.
+        """
+        objs = list(objs)
+        for obj in objs:
+            obj._deleted, obj._deleted_at = False, None
+        update_fields = [
+            f for f in update_fields
+            if f not in ('updated_at', '_deleted', '_deleted_at')
+        ] + ['_deleted', '_deleted_at']
+
+        if django.VERSION >= (4, 1):
+            objs = super().bulk_create(
+                objs, batch_size=batch_size, update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=[*update_fields, 'updated_at'])
+            invalidate_rows(
+                self.model, objs=[o for o in objs if o.pk is not None],
+                using=self.db)
+            touch_model(self.model, using=self.db)
+            self._after_bulk_write(objs, SplintModel.UPSERTED, log_activity)
+            return objs
+
+        opts = self.model._meta
+        attnames = [opts.get_field(f).attname for f in unique_fields]
+        chunk_size = batch_size or DELETE_CHUNK_SIZE
+        existing = {}
+        for i in range(0, len(objs), chunk_size):
+            lookup = reduce(operator.or_, (
+                Q(**{a: getattr(obj, a) for a in attnames})
+                for obj in objs[i:i + chunk_size]))
+            for pk, *values in self.model._base_manager.using(
+                    self.db).filter(lookup).values_list('pk', *attnames):
+                existing[tuple(values)] = pk
+
+        to_create, to_update = [], []
+        for obj in objs:
+            pk = existing.get(tuple(getattr(obj, a) for a in attnames))
+            if pk is None:
+                to_create.append(obj)
+            else:
+                obj.pk = pk
+                obj._state.adding = False
+                to_update.append(obj)
+
+        self.bulk_create(
+            to_create, batch_size=batch_size, log_activity=log_activity)
+        # Soft deleted rows are out of the default manager queryset
+        SplintQuerySet(model=self.model, using=self.db).bulk_update(
+            to_update, update_fields, batch_size=batch_size,
+            log_activity=log_activity)
+        return objs
+
+    bulk_upsert.alters_data = True
+
+    def _after_bulk_write(self, objs, action, log_activity, changes=None,
+                          fields=None):
+        """Snapshot the written `fields` (all by default) of bulk written
+        objects and log their activity."""
+        if not objs:
+            return
+
+        model = self.model
+        if tracked_fields(model).snapshot:
+            for obj in objs:
+                obj.take_snapshot(fields)
 
-class SplintDeletedManager(models.Manager):
+        if log_activity:
+            pk_name = model._meta.pk.name
+            changes = changes or [None] * len(objs)
+            log_activities([
+                activity_record(model, action, obj.activity_object())
+                if obj_changes is None else
+                activity_record(
+                    model, action, {pk_name: obj.pk}, changes=obj_changes)
+                for obj, obj_changes in zip(objs, changes)
+            ], using=self.db)
+
+    def iter_chunks(self, size=1000, key='id', select_related=None,
+                    only=None, flat=False):
+        """Iterate the queryset in chunks with keyset pagination.
+
+        Each chunk is a new query filtering by `key` (a unique field,
+        prefixed with '-' for descending order) after the last fetched
+        value, so memory stays constant and deep chunks are as fast as the
+        first ones. The queryset ordering is replaced by `key`.
+
+        Args:
+            size (int): Number of objects per chunk.
+            key (str): Unique field used to paginate.
+            select_related (Iterable[str], optional): select_related applied
+                to each chunk.
+            only (Iterable[str], optional): only applied to each chunk, the
+                key is always loaded.
+            flat (bool): Yield objects instead of lists of objects.
+
+        Raises:
+            TypeError: The queryset is sliced, or its values()/values_list()
+                rows don't hold the key.
+        """
+        if not self.query.can_filter():
+            raise TypeError('Cannot iterate a sliced queryset in chunks.')
+
+        field = key.lstrip('-')
+        lookup = f'{field}__lt' if key.startswith('-') else f'{field}__gt'
+        get_key_value = self._get_key_getter(field)
+
+        queryset = self.order_by(key)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if only:
+            queryset = queryset.only(*only, field)
+
+        last = None
+        while True:
+            chunk_qs = queryset if last is None else queryset.filter(
+                **{lookup: last})
+            chunk = list(chunk_qs[:size])
+            if not chunk:
+                return
+
+            if flat:
+                yield from chunk
+            else:
+                yield chunk
+
+            if len(chunk) < size:
+                return
+            last = get_key_value(chunk[-1])
+
+    def _get_key_getter(self, field):
+        """Callable reading the key of a model, values() or values_list()
+        row.
+
+        Raises TypeError when values()/values_list() don't select the key.
+        """
+        if self._fields is None:
+            return operator.attrgetter(field)
+
+        opts = self.model._meta
+        names = {field}
+        if field in ('pk', opts.pk.name):
+            names |= {'pk', opts.pk.name, opts.pk.attname}
+        fields = list(self._fields) or [
+            f.attname for f in opts.concrete_fields]
+        index = next(
+            (i for i, name in enumerate(fields) if name in names), None)
+        if index is None:
+            raise TypeError(
+                f'Cannot iterate in chunks by {field!r}, it is not selected '
+                'by values()/values_list().')
+
+        if issubclass(self._iterable_class, ValuesIterable):
+            return operator.itemgetter(fields[index])
+        if issubclass(self._iterable_class, FlatValuesListIterable):
+            return lambda row: row
+        return operator.itemgetter(index)
+
+    def restore(self, chunk_size=DELETE_CHUNK_SIZE, log_activity=True,
+                cascade=False):
+        """Restore soft deleted objects.
+
+        With `cascade=True` related SplintModel rows soft deleted in the same
+        cascade (same `_deleted_at`) are restored too.
+
+        Returns the number of restored objects.
+        """
+        by_deleted_at = defaultdict(list)
+        for pk, deleted, deleted_at in self.values_list(
+                'pk', '_deleted', '_deleted_at'):
+            if deleted:
+                by_deleted_at[deleted_at].append(pk)
+
+        return sum(
+            self._restore_pks(
+                pks, chunk_size=chunk_size, log_activity=log_activity,
+                cascade=cascade, deleted_at=deleted_at)
+            for deleted_at, pks in by_deleted_at.items())
+
+    restore.alters_data = True
+    restore.queryset_only = True
+
+    def _collect_cascade(self, pks):
+        """Related SplintModel rows deleted on cascade, by model.
+
+        Relations are followed level by level by Django's Collector, which
+        raises ProtectedError for protected relations.
+        """
+        collector = Collector(using=self.db)
+        collector.collect(
+            self.model._base_manager.using(self.db).filter(pk__in=pks))
+
+        related = defaultdict(set)
+        for model, instances in collector.data.items():
+            related[model].update(obj.pk for obj in instances)
+        for queryset in collector.fast_deletes:
+            related[queryset.model].update(
+                queryset.values_list('pk', flat=True))
+        related[self.model].difference_update(pks)
+
+        return [
+            (model, list(model_pks)) for model, model_pks in related.items()
+            if model_pks and issubclass(model, SplintModel)
+        ]
+
+    def _soft_delete_pks(self, pks, chunk_size=DELETE_CHUNK_SIZE,
+                         log_activity=True, cascade=False, deleted_at=None):
+        """Soft delete rows by primary key, one UPDATE per chunk."""
+        model = self.model
+        manager = model._base_manager.using(self.db)
+        pk_name = model._meta.pk.name
+        deleted_at = deleted_at or soft_delete_timestamp()
+        count = 0
+
+        for i in range(0, len(pks), chunk_size):
+            chunk = pks[i:i + chunk_size]
+            count += manager.filter(pk__in=chunk, _deleted=False).update(
+                _deleted=True,
+                _deleted_at=deleted_at,
+                updated_at=timezone.now())
+            invalidate_rows(model, pks=chunk, using=self.db)
+            touch_model(model, using=self.db)
+
+            if log_activity:
+                log_activities([
+                    activity_record(model, SplintModel.DELETED, {
+                        pk_name: pk, '_deleted_at': deleted_at})
+                    for pk in chunk
+                ], using=self.db)
+
+            if cascade:
+                self._soft_delete_cascade(
+                    chunk, deleted_at, chunk_size=chunk_size,
+                    log_activity=log_activity)
+
+        return count
+
+    def _soft_delete_cascade(self, pks, deleted_at,
+                             chunk_size=DELETE_CHUNK_SIZE, log_activity=True):
+        """Soft delete related rows of soft deleted rows."""
+        for model, related_pks in self._collect_cascade(pks):
+            related = model._base_manager.using(self.db).filter(
+                pk__in=related_pks, _deleted=False)
+            SplintQuerySet(model=model, using=self.db)._soft_delete_pks(
+                list(related.values_list('pk', flat=True)),
+                chunk_size=chunk_size, log_activity=log_activity,
+                deleted_at=deleted_at)
+
+    def _restore_pks(self, pks, chunk_size=DELETE_CHUNK_SIZE,
+                     log_activity=True, cascade=False, deleted_at=None):
+        """Restore rows by primary key, one UPDATE per chunk."""
+        model = self.model
+        manager = model._base_manager.using(self.db)
+        pk_name = model._meta.pk.name
+        count = 0
+
+        for i in range(0, len(pks), chunk_size):
+            chunk = pks[i:i + chunk_size]
+            count += manager.filter(pk__in=chunk, _deleted=True).update(
+                _deleted=False,
+                _deleted_at=None,
+                updated_at=timezone.now())
+            touch_model(model, using=self.db)
+
+            if log_activity:
+                log_activities([
+                    activity_record(model, SplintModel.RESTORED, {pk_name: pk})
+                    for pk in chunk
+                ], using=self.db)
+
+            if cascade:
+                self._restore_cascade(
+                    chunk, deleted_at, chunk_size=chunk_size,
+                    log_activity=log_activity)
+
+        return count
+
+    def _restore_cascade(self, pks, deleted_at, chunk_size=DELETE_CHUNK_SIZE,
+                         log_activity=True):
+        """Restore related rows soft deleted along with restored rows."""
+        for model, related_pks in self._collect_cascade(pks):
+            related = model._base_manager.using(self.db).filter(
+                pk__in=related_pks, _deleted=True, _deleted_at=deleted_at)
+            SplintQuerySet(model=model, using=self.db)._restore_pks(
+                list(related.values_list('pk', flat=True)),
+                chunk_size=chunk_size, log_activity=log_activity)
+
+    def update(self, **kwargs):
+        """Update rows, invalidating their cached lookups and tags."""
+        pks = None
+        if cached_lookup_fields(self.model):
+            pks = list(self.values_list('pk', flat=True))
+        count = super().update(**kwargs)
+        if pks is not None:
+            invalidate_rows(self.model, pks=pks, using=self.db)
+        touch_model(
+            self.model, fields=None if '_deleted' in kwargs else kwargs,
+            using=self.db)
+        return count
+
+    update.alters_data = True
+
+    def force_delete(self):
+        """Force delete from DB."""
+        pks = None
+        if cached_lookup_fields(self.model):
+            pks = list(self.values_list('pk', flat=True))
+        res = super().delete()
+        if pks is not None:
+            invalidate_rows(self.model, pks=pks, using=self.db)
+        touch_model(self.model, using=self.db)
+        return res
+
+    force_delete.alters_data = True
+    force_delete.queryset_only = True
+
+
+SplintBaseManager = models.Manager.from_queryset(SplintQuerySet)
+
+
+class SplintDeletedManager(SplintBaseManager):
     use_for_related_fields = True
 
     def get_queryset(self, *args, **kwargs):
@@ -24,7 +571,7 @@ class SplintDeletedManager(models.Manager):
                 _deleted=True)
 
 
-class SplintManager(models.Manager):
+class SplintManager(SplintCachedLookupMixin, SplintBaseManager):
     use_for_related_fields = True
 
     def get_queryset(self, *args, **kwargs):
@@ -39,7 +586,7 @@ class SplintManager(models.Manager):
             return None
 
 
-class SplintObjectsWithDeletedManager(models.Manager):
+class SplintObjectsWithDeletedManager(SplintBaseManager):
     use_for_related_fields = True
 
     def get_queryset(self, *args, **kwargs):
@@ -47,26 +594,13 @@ class SplintObjectsWithDeletedManager(models.Manager):
             model=self.model, using=self._db, hints=self._hints)
 
 
-class SplintQuerySet(QuerySet):
-    def delete(self):
-        """
-        Overriding of the delete method.
-
-        This is not the fastest way, altough we garantee that any object will
-        not be completely deleted.
-        """
-        for obj in self:
-            obj.delete()
-
-    def force_delete(self):
-        """Force delete from DB."""
-        return super().delete()
-
-
 class SplintModel(models.Model):
     ADMIN_ORIGIN = 'admin'
     API_ORIGIN = 'api'
 
+    CREATED, UPDATED, DELETED = 'created', 'updated', 'deleted'
+    RESTORED, UPSERTED = 'restored', 'upserted'
+
     created_at = models.DateTimeField('Data de criação', auto_now_add=True)
     updated_at = models.DateTimeField('Data de edição', auto_now=True)
 
@@ -84,60 +618,344 @@ class SplintModel(models.Model):
         original_value_fields = ()
         default_manager_name = 'objects'
 
-    def __init__(self, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
-        original_value_fields = getattr(
-            self._meta, 'original_value_fields', ())
-        list(map(lambda f:
-                 setattr(self, f'__original_{f}', getattr(self, f)),
-                 original_value_fields))
+    def __init__(self, *args, **kwargs):
+        """Snapshot `original_value_fields` of the new object."""
+        super(SplintModel, self).__init__(*args, **kwargs)
+        original = tracked_fields(self.__class__).original
+        if original and not _loading.get():
+            self._initial_state = self.get_field_state(original)
+
+    def __getattr__(self, name):
+        """Original values as `__original_{field_name}`.
+
+        Values come from the snapshot taken when the object was loaded from
+        DB or saved, or, for unsaved objects, when they were created
+        (`original_value_fields`, other fields on first access). Deferred
+        fields are never loaded for it.
+        """
+        if not name.startswith('__original_'):
+            raise AttributeError(
+                f'{type(self).__name__!r} object has no attribute {name!r}')
+
+        field_name = name[len('__original_'):]
+        try:
+            field = self._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            raise AttributeError(
+                f'{type(self).__name__!r} object has no field '
+                f'{field_name!r}') from None
+
+        state = self.get_original_state()
+        if state is None:
+            state = self.__dict__.setdefault('_initial_state', {})
+        if field.attname not in state:
+            if field.attname not in self.__dict__:
+                raise AttributeError(
+                    f'{name!r} is not available, {field.name!r} is deferred.')
+            state[field.attname] = self.get_field_state(
+                (field,))[field.attname]
+
+        value = state[field.attname]
+        if field.is_relation and field_name != field.attname:
+            if value == self.__dict__.get(field.attname):
+                return getattr(self, field.name)
+            return field.related_model._base_manager.filter(pk=value).first()
+        return value
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Keep loaded values to track changes.
+
+        The snapshot dict is only built on first use (`get_original_state`),
+        values of mutable fields are copied right away.
+        """
+        tracked = tracked_fields(cls)
+        if tracked.original:
+            token = _loading.set(True)
+            try:
+                instance = super(SplintModel, cls).from_db(
+                    db, field_names, values)
+            finally:
+                _loading.reset(token)
+        else:
+            instance = super(SplintModel, cls).from_db(db, field_names, values)
+
+        if tracked.snapshot:
+            if tracked.mutable:
+                values = [
+                    deepcopy(value) if name in tracked.mutable else value
+                    for name, value in zip(field_names, values)]
+            instance._loaded_values = (field_names, values)
+        return instance
+
+    def get_original_state(self):
+        """Snapshot by attname, None when not loaded from DB or saved."""
+        values = self.__dict__
+        if '_loaded_values' in values:
+            field_names, loaded = values.pop('_loaded_values')
+            values.setdefault(
+                '_original_state', dict(zip(field_names, loaded)))
+        return values.get('_original_state')
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        """Refresh the snapshot of the reloaded fields."""
+        super(SplintModel, self).refresh_from_db(
+            using=using, fields=fields, **kwargs)
+        state = self.get_field_state()
+        original = self.get_original_state()
+        if fields is not None and original is not None:
+            attnames = {self._meta.get_field(f).attname for f in fields}
+            original.update(
+                (k, v) for k, v in state.items() if k in attnames)
+        else:
+            self._original_state = state
+
+    def take_snapshot(self, fields=None):
+        """Snapshot the object, or only `fields` (names or attnames) when
+        given, the other fields keep their pending changes."""
+        if fields is None:
+            self._original_state = self.get_field_state()
+        elif fields:
+            if self.get_original_state() is None:
+                self._original_state = {}
+            self._original_state.update(self.get_field_state([
+                self._meta.get_field(name) for name in fields]))
+
+    def get_field_state(self, fields=None):
+        """Loaded (non deferred) values by attname, as saved in snapshot."""
+        tracked = tracked_fields(self.__class__)
+        mutable = tracked.mutable
+        values = self.__dict__
+        state = {}
+        for f in fields or tracked.fields:
+            attname = f.attname
+            if attname not in values:
+                continue
+            value = values[attname]
+            if attname in mutable:
+                value = deepcopy(value)
+            elif isinstance(value, FieldFile):
+                value = value.name
+            state[attname] = value
+        return state
+
+    def get_changes(self):
+        """Changed fields since loaded or saved, as {name: [old, new]}.
+
+        Returns None when the object has no snapshot (not loaded from DB).
+        """
+        state = self.get_original_state()
+        if state is None:
+            return None
+
+        values = self.__dict__
+        changes = {}
+        for f in tracked_fields(self.__class__).fields:
+            attname = f.attname
+            if attname not in values:
+                continue
+            new = values[attname]
+            old = state.get(attname, _NOT_LOADED)
+            try:
+                changed = old is _NOT_LOADED or old != new
+            except Exception:
+                changed = True
+            if changed:
+                changes[f.name] = [
+                    None if old is _NOT_LOADED else old, new]
+        return changes
 
     def save(self, log_activity=True, *args, **kwargs):
-        """Save overwrite to log every every action in the system."""
+        """Save overwrite to log every every action in the system.
+
+        Objects loaded from DB only save the changed fields (through
+        `update_fields`) and saving an unchanged object is skipped. Disable
+        it with `Meta.track_changes = False`.
+        """
         action = self.get_action()
+        written_fields = kwargs.get('update_fields')
+
+        changes = None
+        if (action != self.CREATED and not self._state.adding and not args and
+                kwargs.get('update_fields') is None and
+                not kwargs.get('force_insert') and
+                getattr(self._meta, 'track_changes', True)):
+            changes = self.get_changes()
+            if changes is not None:
+                if not changes:
+                    return None
+                kwargs['update_fields'] = set(changes).union(
+                    tracked_fields(self.__class__).always_saved)
 
         res = super(SplintModel, self).save(*args, **kwargs)
 
-        if log_activity:
-            log = {
-                'action': action,
-                'origin': getattr(self, 'origin', None),
-                'user': getattr(self, 'user_id', None),
-                'model': self.__class__.__name__,
-                'object': model_to_dict(self, exclude=getattr(
-                    self, 'exclude_log', None)),
-            }
+        invalidate_rows(type(self), objs=[self], using=self._state.db)
+        update_fields = kwargs.get('update_fields')
+        if (action == self.CREATED or not update_fields or
+                '_deleted' in update_fields):
+            update_fields = None
+        touch_model(type(self), fields=update_fields, using=self._state.db)
 
-            logger.info(log)
+        if tracked_fields(self.__class__).snapshot:
+            self.take_snapshot(written_fields)
+
+        if log_activity:
+            if changes is None:
+                obj, log_changes = self.activity_object(), None
+            else:
+                exclude = getattr(self, 'exclude_log', None) or ()
+                obj = {self._meta.pk.name: self.pk}
+                log_changes = {
+                    k: v for k, v in changes.items() if k not in exclude}
+            log_activities([activity_record(
+                self.__class__, action, obj,
+                origin=getattr(self, 'origin', None),
+                user=getattr(self, 'user_id', None),
+                changes=log_changes)], using=self._state.db)
 
         return res
 
-    def delete(self, *args, **kwargs):
-        """Delete overwrite to perform soft delete."""
+    def activity_object(self):
+        """Values of the object logged on activity records."""
+        return {
+            f.name: f.value_from_object(self)
+            for f in activity_fields(self.__class__)
+        }
+
+    def delete(self, *args, cascade=False, **kwargs):
+        """Delete overwrite to perform soft delete.
+
+        With `cascade=True` related SplintModel rows that would be deleted
+        on cascade are soft deleted too, with set based UPDATEs.
+        """
         self._deleted = True
-        self._deleted_at = datetime.utcnow().replace(
-            tzinfo=timezone.get_current_timezone())
+        self._deleted_at = soft_delete_timestamp()
+        self.save()
+
+        if cascade:
+            SplintQuerySet(model=type(self), using=self._state.db)\
+                ._soft_delete_cascade([self.pk], self._deleted_at)
+
+    def restore(self, cascade=False):
+        """Restore a soft deleted object.
+
+        With `cascade=True` related SplintModel rows soft deleted in the same
+        cascade (same `_deleted_at`) are restored too.
+        """
+        deleted_at = self._deleted_at
+        self._deleted = False
+        self._deleted_at = None
         self.save()
 
+        if cascade:
+            SplintQuerySet(model=type(self), using=self._state.db)\
+                ._restore_cascade([self.pk], deleted_at)
+
     def force_delete(self, *args, **kwargs):
         """Force delete function."""
-        return super(SplintModel, self).delete(*args, **kwargs)
+        pk = self.pk
+        res = super(SplintModel, self).delete(*args, **kwargs)
+        invalidate_rows(
+            type(self), objs=[self], pks=[pk], using=self._state.db)
+        touch_model(type(self), using=self._state.db)
+        return res
 
     def get_action(self):
         """Get action for logging."""
-        CREATED, UPDATED, DELETED = 'created', 'updated', 'deleted'
         action = None
-        if not self.id:
-            action = CREATED
-        elif self._deleted is True:
-            action = DELETED
+        if not self.pk:
+            action = self.CREATED
+        elif self.__dict__.get('_deleted') is True:
+            action = self.DELETED
         else:
-            action = UPDATED
+            action = self.UPDATED
 
         return action
 
 
-class SplintUserManager(UserManager):
+def get_lookup_fields(model):
+    """Field lists filtered on the model: `Meta.lookup_fields` and ordering.
+
+    The default ordering is only considered when lookup fields are declared.
+    Lookup fields given by attname (e.g. 'owner_id') are resolved to their
+    field name, unknown fields raise FieldDoesNotExist.
+    """
+    opts = model._meta
+
+    def field_name(name):
+        prefix = '-' if name.startswith('-') else ''
+        name = name.lstrip('-')
+        if name == 'pk':
+            return prefix + opts.pk.name
+        return prefix + opts.get_field(name).name
+
+    lookups = [
+        [field_name(f) for f in (
+            [fields] if isinstance(fields, str) else fields)]
+        for fields in getattr(opts, 'lookup_fields', None) or ()
+    ]
+    ordering = [
+        o for o in opts.ordering
+        if isinstance(o, str) and o != '?' and '__' not in o
+    ]
+    if lookups and ordering:
+        lookups.append(ordering)
+    return lookups
+
+
+def soft_delete_index_name(model, fields):
+    """Deterministic name (<= 30 chars) of a soft delete partial index."""
+    table = model._meta.db_table
+    digest = hashlib.md5(
+        ':'.join([table, *fields, '_deleted']).encode()).hexdigest()[:8]
+    return f'{table[:14]}_{digest}_sd'
+
+
+def add_soft_delete_indexes(sender, **kwargs):
+    """Add partial indexes (`_deleted=False`) for lookup fields and ordering.
+
+    Fields already indexed with the same columns at `Meta.indexes` are
+    skipped, as models whose soft delete fields live in a parent table.
+    """
+    if not issubclass(sender, SplintModel):
+        return
+
+    opts = sender._meta
+    if opts.proxy or opts.get_field('_deleted').model is not sender:
+        return
+
+    local = {f.name for f in opts.local_concrete_fields}
+    existing = [list(index.fields) for index in opts.indexes]
+    indexes = []
+    for fields in get_lookup_fields(sender):
+        if fields in existing or not all(
+                f.lstrip('-') in local for f in fields):
+            continue
+        existing.append(fields)
+        indexes.append(models.Index(
+            fields=fields,
+            condition=Q(_deleted=False),
+            name=soft_delete_index_name(sender, fields)))
+
+    if indexes:
+        # original_attrs is what migrations read from the model Meta.
+        opts.indexes = opts.original_attrs['indexes'] = [
+            *opts.indexes, *indexes]
+
+
+class_prepared.connect(add_soft_delete_indexes)
+
+
+class SplintUserManager(SplintCachedLookupMixin, UserManager):
+
+    def contribute_to_class(self, cls, name):
+        """Invalidate cached lookups of user models out of SplintModel."""
+        super().contribute_to_class(cls, name)
+        if not cls._meta.abstract and not issubclass(cls, SplintModel):
+            for signal in (post_save, post_delete):
+                signal.connect(
+                    invalidate_on_signal, sender=cls, weak=False,
+                    dispatch_uid=f'splint_cache_{cls._meta.label_lower}')
 
     def _create_user(self, email, password, **extra_fields):
         """Create and save a User with the given email and password."""
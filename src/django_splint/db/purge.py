@@ -0,0 +1,224 @@
+import json
+import os
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import (
+    CASCADE, DO_NOTHING, PROTECT, RESTRICT, Exists, OuterRef, ProtectedError,
+    RestrictedError)
+from django.utils import timezone
+
+from django_splint.activity import activity_record, log_activities
+from django_splint.db.models import SplintModel
+from django_splint.task import SplintTask
+
+PURGED = 'purged'
+
+# Deletions blocked by any referencing row: it would be deleted with the
+# purged row (without archive nor activity), or the delete would fail.
+BLOCKING_ON_DELETE = (CASCADE, PROTECT, RESTRICT, DO_NOTHING)
+CHECKPOINT_KEY = 'splint:purge:{}'
+
+
+def get_retention(model):
+    """Retention of soft deleted rows, from `Meta.deleted_retention`.
+
+    The retention may be a timedelta or a number of days.
+    """
+    retention = getattr(model._meta, 'deleted_retention', None)
+    if retention is None or isinstance(retention, timedelta):
+        return retention
+    return timedelta(days=retention)
+
+
+def get_purge_models(labels=None):
+    """SplintModels with retention, ordered children first.
+
+    Models are ordered so that a model is purged before the models it points
+    to with foreign keys.
+    """
+    if labels:
+        candidates = [apps.get_model(label) for label in labels]
+    else:
+        candidates = [
+            model for model in apps.get_models()
+            if issubclass(model, SplintModel) and get_retention(model)
+        ]
+
+    ordered, visited = [], set()
+
+    def visit(model):
+        if model in visited:
+            return
+        visited.add(model)
+        for related in model._meta.related_objects:
+            if related.related_model in candidates:
+                visit(related.related_model)
+        ordered.append(model)
+
+    for model in candidates:
+        visit(model)
+    return ordered
+
+
+class JSONLinesArchiver:
+    """Archive rows as JSON lines at `{directory}/{app_label}.{model}.jsonl`."""
+
+    def __init__(self, directory):
+        """Constructor."""
+        self.directory = directory
+
+    def __call__(self, model, queryset):
+        path = os.path.join(self.directory, f'{model._meta.label_lower}.jsonl')
+        rows = list(queryset.values())
+        with open(path, 'a') as f:
+            f.write(''.join(
+                json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows))
+        return len(rows)
+
+
+class SplintPurger:
+    """Hard delete rows soft deleted for longer than the model retention.
+
+    Rows are scanned in primary key order and purged in chunks, each chunk in
+    its own transaction, sleeping `sleep` seconds between chunks. The last
+    purged primary key is kept in cache, so an interrupted purge resumes
+    from it.
+
+    Rows referenced through CASCADE, PROTECT, RESTRICT or DO_NOTHING foreign
+    keys are kept until the referencing rows are purged themselves (children
+    are purged first by `purge_deleted`), rows referenced through SET_NULL
+    or SET_DEFAULT ones are kept while referenced by not deleted SplintModel
+    rows. Kept rows are counted in the stats.
+    """
+
+    def __init__(self, model, retention=None, chunk_size=None, sleep=None,
+                 archive=None, dry_run=False, resume=True):
+        """Constructor."""
+        self.model = model
+        self.retention = retention or get_retention(model)
+        self.chunk_size = chunk_size or getattr(
+            settings, 'SPLINT_PURGE_CHUNK_SIZE', 500)
+        self.sleep = getattr(
+            settings, 'SPLINT_PURGE_SLEEP', 0) if sleep is None else sleep
+        self.archive = archive
+        self.dry_run = dry_run
+        self.resume = resume
+        self.checkpoint_key = CHECKPOINT_KEY.format(model._meta.label_lower)
+
+    def get_expired(self):
+        """Soft deleted rows out of retention."""
+        if self.retention is None:
+            raise ValueError(
+                f'{self.model._meta.label} has no Meta.deleted_retention.')
+
+        return self.model.deleted.filter(
+            _deleted_at__lt=timezone.now() - self.retention)
+
+    def get_queryset(self):
+        """Expired rows not referenced by rows that block their delete."""
+        queryset = self.get_expired()
+
+        for related in self.model._meta.related_objects:
+            if related.many_to_many:
+                continue
+            related_model = related.related_model
+            references = related_model._base_manager.filter(**{
+                related.field.name: OuterRef(
+                    related.field.target_field.attname)})
+            if related.on_delete not in BLOCKING_ON_DELETE:
+                if not issubclass(related_model, SplintModel):
+                    continue
+                references = references.filter(_deleted=False)
+
+            alias = f'_referenced_{related.name}'
+            queryset = queryset.annotate(
+                **{alias: Exists(references)}).filter(**{alias: False})
+
+        return queryset.order_by('pk')
+
+    def reset(self):
+        """Forget the checkpoint of a previous run."""
+        cache.delete(self.checkpoint_key)
+
+    def purge(self):
+        """Run the purge, returns its stats."""
+        queryset = self.get_queryset()
+        last_pk = cache.get(self.checkpoint_key) if self.resume else None
+        stats = {
+            'model': self.model._meta.label,
+            'purged': 0,
+            'archived': 0,
+            'kept': 0,
+            'resumed_from': last_pk,
+        }
+
+        if self.dry_run:
+            if last_pk is not None:
+                queryset = queryset.filter(pk__gt=last_pk)
+            stats['purged'] = queryset.count()
+            stats['kept'] = self.get_expired().count() - stats['purged']
+            return stats
+
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(
+                pk__gt=last_pk)
+            pks = list(chunk.values_list('pk', flat=True)[:self.chunk_size])
+            if not pks:
+                break
+
+            stats['purged'] += self.purge_chunk(pks, stats)
+            last_pk = pks[-1]
+            cache.set(self.checkpoint_key, last_pk, timeout=None)
+
+            if self.sleep:
+                time.sleep(self.sleep)
+
+        stats['kept'] = self.get_expired().count()
+        self.reset()
+        return stats
+
+    def purge_chunk(self, pks, stats):
+        """Archive and hard delete a chunk of rows."""
+        rows = self.model.deleted.filter(pk__in=pks)
+        try:
+            with transaction.atomic(using=rows.db):
+                if self.archive is not None:
+                    archived = self.archive(self.model, rows)
+                rows.force_delete()
+        except (ProtectedError, RestrictedError):
+            # Referenced since the chunk was selected, kept for a next run
+            return 0
+
+        if self.archive is not None:
+            stats['archived'] += archived
+
+        log_activities([
+            activity_record(self.model, PURGED, {self.model._meta.pk.name: pk})
+            for pk in pks
+        ], using=rows.db)
+        return len(pks)
+
+
+def purge_deleted(labels=None, **kwargs):
+    """Purge every model with retention (or the given model labels)."""
+    return [
+        SplintPurger(model, **kwargs).purge()
+        for model in get_purge_models(labels)
+    ]
+
+
+class PurgeDeletedTask(SplintTask):
+    """Purge soft deleted rows on ECS.
+
+    Usage: PurgeDeletedTask().run_task('app_label.Model', ...)
+    """
+
+    def run(self, *args):
+        """Execute task."""
+        return purge_deleted(args or None)
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from django_splint.utils import stats
+
+COLUMNS = (
+    ('name', 'name', '{}'),
+    ('hits', 'hits', '{:.0f}'),
+    ('misses', 'misses', '{:.0f}'),
+    ('hit %', 'hit_ratio', '{:.1%}'),
+    ('local %', 'local_ratio', '{:.1%}'),
+    ('computes', 'computes', '{:.0f}'),
+    ('compute ms', 'avg_compute_ms', '{:.1f}'),
+    ('bytes', 'avg_value_bytes', '{:.0f}'),
+    ('decode ms', 'decode_seconds', '{:.1f}'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Report the hottest, most missed or slowest splint_cached_property '
+        'and splint_cached_function values, from the stats published in '
+        'cache by every process (SPLINT_CACHE_STATS).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='Number of decorators reported.')
+        parser.add_argument(
+            '--sort', default='misses',
+            help='Event or column to sort by (hits, misses, hit_ratio, '
+                 'compute_seconds, avg_compute_ms, decode_seconds, ...).')
+        parser.add_argument(
+            '--prometheus', action='store_true',
+            help='Print every stat in the Prometheus text format.')
+
+    def handle(self, *args, **options):
+        data = stats.collect()
+        if not data:
+            self.stdout.write(
+                'No cache stats published, is SPLINT_CACHE_STATS enabled?')
+            return
+        if options['prometheus']:
+            self.stdout.write(stats.prometheus_text(data), ending='')
+            return
+
+        rows = [[header for header, _, _ in COLUMNS]]
+        for row in stats.report(data, options['top'], options['sort']):
+            rows.append([
+                fmt.format(row[key] * 1000 if key == 'decode_seconds'
+                           else row[key])
+                for _, key, fmt in COLUMNS
+            ])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+        for row in rows:
+            self.stdout.write('  '.join(
+                [row[0].ljust(widths[0])] +
+                [value.rjust(width) for value, width in zip(row[1:], widths[1:])]))
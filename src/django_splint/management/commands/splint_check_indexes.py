@@ -0,0 +1,88 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q, UniqueConstraint
+
+from django_splint.db.models import SplintModel, get_lookup_fields
+
+SOFT_DELETE_CONDITION = Q(_deleted=False)
+
+
+def get_model_indexes(model):
+    """Indexed field lists of a model, with the partial index flag."""
+    opts = model._meta
+    indexes = [
+        ([f.lstrip('-') for f in index.fields],
+         index.condition == SOFT_DELETE_CONDITION)
+        for index in opts.indexes
+    ]
+    indexes += [(list(fields), False) for fields in opts.unique_together]
+    indexes += [
+        (list(constraint.fields),
+         constraint.condition == SOFT_DELETE_CONDITION)
+        for constraint in opts.constraints
+        if isinstance(constraint, UniqueConstraint) and constraint.fields
+    ]
+    indexes += [
+        ([f.name], False) for f in opts.local_concrete_fields
+        if f.primary_key or f.unique or f.db_index
+    ]
+    return indexes
+
+
+def check_model(model):
+    """Issues of the model hot filters without a (partial) index."""
+    hot = get_lookup_fields(model) or [[
+        o for o in model._meta.ordering
+        if isinstance(o, str) and o != '?' and '__' not in o
+    ]]
+    indexes = get_model_indexes(model)
+
+    issues = []
+    for fields in filter(None, hot):
+        columns = [f.lstrip('-') for f in fields]
+        matches = [
+            partial for indexed, partial in indexes
+            if indexed[:len(columns)] == columns or
+            ('_deleted' in indexed and
+             [f for f in indexed if f != '_deleted'][:len(columns)] == columns)
+        ]
+        if not matches:
+            issues.append(f'no index for {tuple(fields)}')
+        elif not any(matches):
+            issues.append(
+                f'{tuple(fields)} indexed without the _deleted=False '
+                'condition')
+    return issues
+
+
+class Command(BaseCommand):
+    help = (
+        'Report SplintModels whose lookup fields (Meta.lookup_fields) and '
+        'default ordering have no partial index for not deleted rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing-only', action='store_true',
+            help='Report only filters without any index.')
+        parser.add_argument(
+            '--fail', action='store_true',
+            help='Exit with error when any issue is reported.')
+
+    def handle(self, *args, **options):
+        count = 0
+        for model in apps.get_models():
+            opts = model._meta
+            if (not issubclass(model, SplintModel) or opts.proxy or
+                    not opts.managed):
+                continue
+
+            for issue in check_model(model):
+                if options['missing_only'] and not issue.startswith('no '):
+                    continue
+                count += 1
+                self.stdout.write(f'{opts.label}: {issue}')
+
+        if count and options['fail']:
+            raise CommandError(f'{count} index issues found.')
+        if not count:
+            self.stdout.write('No index issues found.')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from django_splint.db.purge import (
+    JSONLinesArchiver, PurgeDeletedTask, SplintPurger, get_purge_models)
+
+
+class Command(BaseCommand):
+    help = (
+        'Hard delete rows soft deleted for longer than the model '
+        'Meta.deleted_retention.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models', nargs='*',
+            help='Model labels (app_label.Model), defaults to every model '
+                 'with retention.')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument(
+            '--sleep', type=float, default=None,
+            help='Seconds to sleep between chunks.')
+        parser.add_argument(
+            '--archive-dir', default=None,
+            help='Archive purged rows as JSON lines in this directory.')
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Ignore checkpoints of previous runs.')
+        parser.add_argument(
+            '--ecs', action='store_true', help='Run as a task on AWS ECS.')
+
+    def handle(self, *args, **options):
+        if options['ecs']:
+            PurgeDeletedTask().run_task(*options['models'])
+            self.stdout.write('Purge task started on ECS.')
+            return
+
+        archive = None
+        if options['archive_dir']:
+            archive = JSONLinesArchiver(options['archive_dir'])
+
+        for model in get_purge_models(options['models']):
+            purger = SplintPurger(
+                model,
+                chunk_size=options['chunk_size'],
+                sleep=options['sleep'],
+                archive=archive,
+                dry_run=options['dry_run'])
+            if options['reset']:
+                purger.reset()
+
+            stats = purger.purge()
+            self.stdout.write(
+                '{model}: {purged} purged, {archived} archived, '
+                '{kept} kept'.format(**stats))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+
+from django_splint.db.images import (
+    RerenderImagesTask, SplintImageRerenderer, get_image_models)
+
+
+class Command(BaseCommand):
+    help = (
+        'Process SplintImageField images not processed with the current '
+        'field settings (width, height, quality...).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models', nargs='*',
+            help='Model labels (app_label.Model), defaults to every model '
+                 'with SplintImageFields.')
+        parser.add_argument(
+            '--fields', nargs='+', default=None,
+            help='Only these image fields.')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Worker processes, 0 to process in this process.')
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Ignore checkpoints of previous runs.')
+        parser.add_argument(
+            '--as-tasks', action='store_true',
+            help='Run a task on AWS ECS for each model.')
+
+    def handle(self, *args, **options):
+        models = get_image_models(options['models'])
+
+        if options['as_tasks']:
+            for model in models:
+                RerenderImagesTask().run_task(
+                    model._meta.label, *(options['fields'] or []))
+                self.stdout.write(
+                    f'{model._meta.label}: re-rendition task started on ECS.')
+            return
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    '{model}: {processed} processed, {skipped} skipped, '
+                    '{failed} failed'.format(**stats))
+
+        for model in models:
+            renderer = SplintImageRerenderer(
+                model,
+                field_names=options['fields'],
+                chunk_size=options['chunk_size'],
+                workers=options['workers'])
+            if options['reset']:
+                renderer.reset()
+
+            stats = renderer.run(progress=progress)
+            self.stdout.write(
+                '{model}: {processed} processed, {skipped} skipped, '
+                '{failed} failed in {elapsed:.1f}s '
+                '({images_per_second:.1f} images/s)'.format(**stats))
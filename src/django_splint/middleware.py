@@ -0,0 +1,13 @@
+from django_splint.db.cache import identity_map
+
+
+class SplintIdentityMapMiddleware:
+    """Share instances of cached lookups (`get_cached`) within a request."""
+
+    def __init__(self, get_response):
+        """Constructor."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity_map():
+            return self.get_response(request)
@@ -19,6 +19,14 @@ class AWSSQSHandler:
 
         return self.client.send_message(**kwargs)
 
+    def send_message_batch(self, **kwargs):
+        for entry in kwargs.get("Entries", []):
+            attributes = entry.get("MessageAttributes")
+            if attributes:
+                self._sqs_attributes_cleaner(attributes)
+
+        return self.client.send_message_batch(**kwargs)
+
     def _sqs_attributes_cleaner(self, attributes):
         """Transform SQS attributes from Lambda event to SQS message."""
         d = dict.fromkeys(attributes)
@@ -0,0 +1,455 @@
+import hashlib
+import importlib
+import json
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+_NOT_FOUND = object()
+
+TAG_PREFIX = 'splint:tag:v1'
+ROWS_TAG = '*'
+
+LOCAL = 'local'
+SHARED = 'shared'
+
+# Header of encoded values: magic, serializer and compression codes.
+CODEC_MAGIC = b'\x93spc'
+SERIALIZERS = {'pickle': b'p', 'json': b'j', 'msgpack': b'm'}
+COMPRESSIONS = {None: b'-', 'zlib': b'z', 'lz4': b'l'}
+CODEC_MODULES = {'zlib': 'zlib', 'lz4': 'lz4.frame'}
+
+
+# Values kept as is by LocalCache, others are pickled.
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+
+
+class LocalCache:
+    """Bounded, thread safe, in-process LRU of (value, version, fresh_until).
+
+    Values other than strings, bytes and numbers are stored pickled, as
+    Django's locmem cache does, so callers mutating a value they got don't
+    change the cached one.
+    """
+
+    def __init__(self, max_entries=1000):
+        """Constructor."""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        value, pickled, version, fresh_until = entry
+        if pickled:
+            value = pickle.loads(value)
+        return value, version, fresh_until
+
+    def set(self, key, value, version, fresh_until):
+        pickled = not isinstance(value, IMMUTABLE_TYPES)
+        if pickled:
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = (value, pickled, version, fresh_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, key, fresh_until):
+        """Extend the freshness of an entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (*entry[:3], fresh_until)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class TwoTierCache:
+    """Django cache fronted by an in-process LRU.
+
+    Values read from or written to the shared cache are kept locally for
+    `local_timeout` seconds, hits in that window cost no I/O. Each value is
+    stored with a version key, changed on every write: once a local entry
+    is older than `local_timeout` only its version is read from the shared
+    cache, so a write in any process invalidates the local copies of every
+    other process after `local_timeout` at most, without fetching values
+    that did not change.
+
+    `add` is not tiered, it goes to the shared cache (locks).
+    """
+
+    def __init__(self, alias='default', local_timeout=5, max_entries=1000):
+        """Constructor."""
+        self.shared = caches[alias]
+        self.local = LocalCache(max_entries)
+        self.local_timeout = local_timeout
+
+    @staticmethod
+    def version_key(key):
+        return f'{key}:version'
+
+    def get(self, key, default=None):
+        return self.get_with_tier(key, default)[0]
+
+    def get_with_tier(self, key, default=None):
+        """Value and the tier it was read from, 'local', 'shared' or None."""
+        entry = self.local.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            value, version, fresh_until = entry
+            if now < fresh_until:
+                return value, LOCAL
+            if version is not None and self.shared.get(
+                    self.version_key(key)) == version:
+                self.local.refresh(key, now + self.local_timeout)
+                return value, LOCAL
+
+        found = self.shared.get_many([key, self.version_key(key)])
+        if key not in found:
+            self.local.delete(key)
+            return default, None
+
+        self.local.set(key, found[key], found.get(self.version_key(key)),
+                       now + self.local_timeout)
+        return found[key], SHARED
+
+    def set(self, key, value, timeout=None):
+        version = uuid.uuid4().hex
+        self.shared.set_many(
+            {key: value, self.version_key(key): version}, timeout=timeout)
+        if timeout != 0:
+            local_timeout = self.local_timeout if timeout is None else min(
+                self.local_timeout, timeout)
+            self.local.set(
+                key, value, version, time.monotonic() + local_timeout)
+
+    def get_many(self, keys):
+        return self.get_many_with_tiers(keys)[0]
+
+    def get_many_with_tiers(self, keys):
+        """Values found and the keys of those read from the local tier."""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        for key in keys:
+            entry = self.local.get(key)
+            if entry is not None and now < entry[2]:
+                found[key] = entry[0]
+            else:
+                missing.append(key)
+        local_keys = set(found)
+        if not missing:
+            return found, local_keys
+
+        shared = self.shared.get_many(
+            missing + [self.version_key(key) for key in missing])
+        for key in missing:
+            if key in shared:
+                found[key] = shared[key]
+                self.local.set(key, shared[key], shared.get(
+                    self.version_key(key)), now + self.local_timeout)
+        return found, local_keys
+
+    def set_many(self, data, timeout=None):
+        versions = {
+            self.version_key(key): uuid.uuid4().hex for key in data}
+        self.shared.set_many({**data, **versions}, timeout=timeout)
+        if timeout != 0:
+            local_timeout = self.local_timeout if timeout is None else min(
+                self.local_timeout, timeout)
+            for key, value in data.items():
+                self.local.set(
+                    key, value, versions[self.version_key(key)],
+                    time.monotonic() + local_timeout)
+
+    def get_or_set(self, key, default, timeout=None):
+        value = self.get(key, _NOT_FOUND)
+        if value is _NOT_FOUND:
+            value = default() if callable(default) else default
+            self.set(key, value, timeout=timeout)
+        return value
+
+    def add(self, key, value, timeout=None):
+        return self.shared.add(key, value, timeout=timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete_many([key, self.version_key(key)])
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.local.delete(key)
+        self.shared.delete_many(
+            list(keys) + [self.version_key(key) for key in keys])
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+
+_two_tier_caches = {}
+_two_tier_lock = threading.Lock()
+
+
+def get_two_tier_cache(alias='default'):
+    """Process wide TwoTierCache of a cache alias.
+
+    Configured with `SPLINT_LOCAL_CACHE_TIMEOUT` (seconds, default 5) and
+    `SPLINT_LOCAL_CACHE_MAX_ENTRIES` (default 1000).
+    """
+    if alias not in _two_tier_caches:
+        with _two_tier_lock:
+            if alias not in _two_tier_caches:
+                _two_tier_caches[alias] = TwoTierCache(
+                    alias,
+                    local_timeout=getattr(
+                        settings, 'SPLINT_LOCAL_CACHE_TIMEOUT', 5),
+                    max_entries=getattr(
+                        settings, 'SPLINT_LOCAL_CACHE_MAX_ENTRIES', 1000),
+                )
+    return _two_tier_caches[alias]
+
+
+def get_with_tier(cache, key, default=None):
+    """Value of any cache and the tier it was read from (see TwoTierCache)."""
+    if isinstance(cache, TwoTierCache):
+        return cache.get_with_tier(key, default)
+    value = cache.get(key, _NOT_FOUND)
+    if value is _NOT_FOUND:
+        return default, None
+    return value, SHARED
+
+
+def get_many_with_tiers(cache, keys):
+    """Values of any cache and the keys read from the local tier."""
+    if isinstance(cache, TwoTierCache):
+        return cache.get_many_with_tiers(keys)
+    return cache.get_many(keys), set()
+
+
+def _import_codec_module(name, path):
+    try:
+        return importlib.import_module(path)
+    except ImportError:
+        raise ImproperlyConfigured(
+            f'The {name!r} cache codec requires the {path.split(".")[0]!r} '
+            'package.') from None
+
+
+class ValueCodec:
+    """Encode cached values as bytes, compressed over a size threshold.
+
+    Encoded values are prefixed with a header naming their serializer and
+    compression, so values written with other settings still decode.
+    'pickle' values without compression, or below the threshold, are stored
+    as they are (the cache backend pickles them).
+
+    'json' stores lists and dicts of JSON types (dates, decimals and UUIDs
+    become strings, tuples become lists), 'msgpack' and 'lz4' require their
+    packages.
+    """
+
+    def __init__(self, serializer='pickle', compression=None, threshold=1024):
+        """Constructor."""
+        if serializer not in SERIALIZERS:
+            raise ImproperlyConfigured(
+                f'Unknown cache serializer {serializer!r}.')
+        if compression not in COMPRESSIONS:
+            raise ImproperlyConfigured(
+                f'Unknown cache compression {compression!r}.')
+        if serializer == 'msgpack':
+            _import_codec_module(serializer, 'msgpack')
+        if compression is not None:
+            _import_codec_module(compression, CODEC_MODULES[compression])
+
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+
+    @property
+    def native(self):
+        return self.serializer == 'pickle' and self.compression is None
+
+    @property
+    def lossy(self):
+        """Whether values read back may differ from those encoded (json)."""
+        return self.serializer != 'pickle'
+
+    def encode(self, value):
+        if self.native:
+            return value
+
+        if self.serializer == 'pickle':
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        elif self.serializer == 'json':
+            data = json.dumps(
+                value, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+        else:
+            data = importlib.import_module('msgpack').packb(
+                value, use_bin_type=True)
+
+        compression = None
+        if self.compression is not None and len(data) >= self.threshold:
+            compression = self.compression
+            data = importlib.import_module(
+                CODEC_MODULES[compression]).compress(data)
+        elif self.serializer == 'pickle':
+            return value
+        return (CODEC_MAGIC + SERIALIZERS[self.serializer] +
+                COMPRESSIONS[compression] + data)
+
+
+_SERIALIZER_NAMES = {code: name for name, code in SERIALIZERS.items()}
+_COMPRESSION_NAMES = {code: name for name, code in COMPRESSIONS.items()}
+
+
+def is_encoded(value):
+    return isinstance(value, bytes) and value.startswith(CODEC_MAGIC)
+
+
+def decode_value(value):
+    """Value encoded by any ValueCodec, other values as they are."""
+    if not is_encoded(value):
+        return value
+
+    header = len(CODEC_MAGIC)
+    serializer = _SERIALIZER_NAMES[value[header:header + 1]]
+    compression = _COMPRESSION_NAMES[value[header + 1:header + 2]]
+    data = value[header + 2:]
+    if compression is not None:
+        data = importlib.import_module(
+            CODEC_MODULES[compression]).decompress(data)
+
+    if serializer == 'pickle':
+        return pickle.loads(data)
+    if serializer == 'json':
+        return json.loads(data)
+    return importlib.import_module('msgpack').unpackb(data, raw=False)
+
+
+def get_value_codec(serializer=None, compression=None, threshold=None):
+    """ValueCodec with `SPLINT_CACHE_CODEC` ('pickle'),
+    `SPLINT_CACHE_COMPRESSION` (None) and
+    `SPLINT_CACHE_COMPRESSION_THRESHOLD` (bytes, 1024) as defaults.
+    """
+    return ValueCodec(
+        serializer or getattr(settings, 'SPLINT_CACHE_CODEC', 'pickle'),
+        compression or getattr(settings, 'SPLINT_CACHE_COMPRESSION', None),
+        getattr(settings, 'SPLINT_CACHE_COMPRESSION_THRESHOLD', 1024)
+        if threshold is None else threshold,
+    )
+
+
+# Generation tags: {model label: {field names, or None for the model}}
+_dependencies = defaultdict(set)
+
+
+def tag_key(label, name=None):
+    return f'{TAG_PREFIX}:{label}' if name is None else \
+        f'{TAG_PREFIX}:{label}:{name}'
+
+
+def register_dependencies(depends_on):
+    """Tag keys of `depends_on` models ('app_label.Model' or model classes)
+    and fields ('app_label.Model.field').
+
+    A model dependency is invalidated by any write to the model, a field
+    dependency by rows created, deleted or restored and by updates of the
+    field.
+    """
+    if isinstance(depends_on, str) or not hasattr(depends_on, '__iter__'):
+        depends_on = [depends_on]
+
+    tags = []
+    for dependency in depends_on:
+        if isinstance(dependency, str):
+            label, _, field = dependency.lower().partition('.')
+            model, _, field = field.partition('.')
+            label = f'{label}.{model}'
+        else:
+            label, field = dependency._meta.label_lower, ''
+
+        if field:
+            _dependencies[label].add(field)
+            tags += [tag_key(label, ROWS_TAG), tag_key(label, field)]
+        else:
+            _dependencies[label].add(None)
+            tags.append(tag_key(label))
+    return tags
+
+
+def get_tags_cache(local=False):
+    """Cache of the generation tags, always the 'default' alias.
+
+    Decorators cached in another alias read their tags from here too, so
+    they see the tags bumped by `touch_model`.
+    """
+    return get_two_tier_cache() if local else caches['default']
+
+
+def get_tags_version(tags, cache):
+    """Short hash of the current generation of tags."""
+    versions = cache.get_many(tags)
+    missing = {tag: uuid.uuid4().hex for tag in tags if tag not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+
+    generation = ':'.join(versions[tag] for tag in tags)
+    return hashlib.md5(generation.encode()).hexdigest()[:12]
+
+
+def touch_model(model, fields=None, using=None):
+    """Bump the generation tags of a model written to.
+
+    `fields` are the updated fields, None when rows were created, deleted or
+    restored (or the updated fields are unknown). Tags are bumped right
+    away and again when the transaction commits.
+    """
+    label = model._meta.label_lower
+    dependencies = _dependencies.get(label)
+    if not dependencies:
+        return
+
+    tags = [tag_key(label)] if None in dependencies else []
+    if fields is None:
+        if dependencies - {None}:
+            tags.append(tag_key(label, ROWS_TAG))
+    else:
+        opts = model._meta
+        for field in fields:
+            try:
+                field = opts.get_field(field).name
+            except FieldDoesNotExist:
+                pass
+            if field in dependencies:
+                tags.append(tag_key(label, field))
+    if not tags:
+        return
+
+    def bump():
+        get_tags_cache(local=True).set_many(
+            {tag: uuid.uuid4().hex for tag in tags}, timeout=None)
+
+    bump()
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(bump, using=using)
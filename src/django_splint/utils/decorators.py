@@ -1,16 +1,42 @@
+import hashlib
+import inspect
 import json
+import logging
+import math
+import random
+import threading
+import time
 import warnings
 
+from collections import namedtuple
 from functools import wraps
 
 from django.core.cache import caches
-from django.utils.version import PY36, get_docs_version
+from django.db import connections, models
+from django.utils.version import get_docs_version
 from typing import Callable, Optional, TypeVar, Any
-from django.core.cache import cache
+
+from django_splint.utils import stats
+from django_splint.utils.cache import (
+    decode_value, get_many_with_tiers, get_tags_cache, get_tags_version,
+    get_two_tier_cache, get_value_codec, get_with_tier, is_encoded,
+    register_dependencies)
+
+try:
+    from django.utils.version import PY36
+except ImportError:  # Django >= 4.0 only supports Python >= 3.6
+    PY36 = True
+
+logger = logging.getLogger(__name__)
 
 _T = TypeVar('_T')
 _NOT_FOUND = object()
 
+LOCK_POLL_INTERVAL = 0.05
+
+# Cached value with its soft expiration time and computation duration.
+CachedValue = namedtuple('CachedValue', ('value', 'expires_at', 'delta'))
+
 
 class splint_cached_property:
     name = None
@@ -28,10 +54,19 @@ class splint_cached_property:
 
     def __init__(
         self,
-        func: Callable[..., _T],
+        func: Callable[..., _T] = None,
         name: str = None,
         cache_key: Callable[..., _T] = None,
         cache_expires: Optional[int] = 60 * 60 * 3,
+        lock: bool = False,
+        lock_timeout: int = 30,
+        stale_ttl: Optional[int] = None,
+        early_expiration: float = 0,
+        local: bool = False,
+        depends_on=None,
+        codec: Optional[str] = None,
+        compression: Optional[str] = None,
+        compression_threshold: Optional[int] = None,
     ):
         """Class to saves properties in cache services.
 
@@ -50,6 +85,33 @@ class splint_cached_property:
                 Its the number of seconds the value should be stored in the cache. 
                 A timeout of 0 wont cache the value. 
                 Defaults to three hours for expires cache value.
+            lock (bool, optional): Only one caller (holding a cache lock)
+                computes a missing value, the others return the stale value
+                or wait up to `lock_timeout` seconds for it.
+            lock_timeout (int, optional): Seconds the lock is held at most.
+            stale_ttl (Optional[int], optional): Seconds an expired value is
+                still served while one caller refreshes it in background.
+            early_expiration (float, optional): Beta of the probabilistic
+                early expiration (XFetch), values are recomputed before they
+                expire more likely the closer to expiration and the longer
+                they take to compute. 1 is a good default, 0 disables it.
+            local (bool, optional): Keep values in the in-process tier too
+                (see `django_splint.utils.cache.TwoTierCache`).
+            depends_on (optional): Models ('app_label.Model' or classes) or
+                fields ('app_label.Model.field') the value depends on. Writes
+                through SplintModel (save, delete, bulk and queryset
+                updates) invalidate it at once.
+            codec (Optional[str], optional): Serializer of the cached
+                value, 'pickle' (stored as is), 'json' or 'msgpack'.
+                Defaults to `SPLINT_CACHE_CODEC`.
+            compression (Optional[str], optional): 'zlib' or 'lz4' for
+                values over `compression_threshold` bytes. Defaults to
+                `SPLINT_CACHE_COMPRESSION`.
+            compression_threshold (Optional[int], optional): Defaults to
+                `SPLINT_CACHE_COMPRESSION_THRESHOLD`.
+
+        Usage: @splint_cached_property or
+            @splint_cached_property(lock=True, stale_ttl=60 * 10)
 
         Raises:
             TypeError: Cannot assign the same splint_cached_property to two different names.
@@ -60,7 +122,29 @@ class splint_cached_property:
         Returns:
             Picklable: picklable Python object.
         """
+        self.cache_key = cache_key
+        self.cache_expires = cache_expires
+        self.lock = lock
+        self.lock_timeout = lock_timeout
+        self.stale_ttl = stale_ttl
+        self.early_expiration = early_expiration
+        self.local = local
+        self.tags = register_dependencies(depends_on) if depends_on else []
+        self.codec_options = (codec, compression, compression_threshold)
+        self._codec = None
+
+        self._name = name
+
+        if func is not None:
+            self._set_func(func, name)
+
+    def __call__(self, func):
+        """Decorate the function when created with options only."""
+        self._set_func(func, self._name)
+        return self
 
+    def _set_func(self, func, name):
+        self.stats_name = f'{func.__module__}.{func.__qualname__}'
         if PY36:
             self.real_func = func
         else:
@@ -81,8 +165,6 @@ class splint_cached_property:
             self.name = name
             self.func = func
 
-        self.cache_key = cache_key
-        self.cache_expires = cache_expires
         self.__doc__ = getattr(func, '__doc__')
 
     def __set_name__(self, owner, name):
@@ -117,27 +199,7 @@ class splint_cached_property:
         cache_value = instance_cache.get(self.name, _NOT_FOUND)
 
         if cache_value is _NOT_FOUND:
-            if self.cache_key is None:
-                try:
-                    cache_key = getattr(
-                        instance, f'{self.name}__cache_key')()
-                except AttributeError:
-                    msg = (
-                        f"No '{self.name}__cache_key' attribute on instance to cache "
-                        f"{self.name!r} property."
-                    )
-                    raise TypeError(msg) from None
-            else:
-                cache_key = self.cache_key(instance)
-
-            cache_value = cache.get(cache_key)
-
-        if not cache_value:
-            cache_value = self.func(instance)
-            cache.set(
-                key=cache_key,
-                value=cache_value,
-                timeout=self.cache_expires)
+            cache_value = self.get_cached(instance, self.get_cache_key(instance))
 
             try:
                 instance_cache[self.name] = cache_value
@@ -148,29 +210,372 @@ class splint_cached_property:
                 )
                 warnings.warn(msg, Warning)
 
-        if not isinstance(cache_value, dict):
+        return cache_value
+
+    def get_cache_key(self, instance, tags_version=None):
+        if self.cache_key is not None:
+            cache_key = self.cache_key(instance)
+        else:
+            try:
+                cache_key = getattr(instance, f'{self.name}__cache_key')()
+            except AttributeError:
+                msg = (
+                    f"No '{self.name}__cache_key' attribute on instance to cache "
+                    f"{self.name!r} property."
+                )
+                raise TypeError(msg) from None
+
+        if self.tags:
+            cache_key += f':{tags_version or self.get_tags_version()}'
+        return cache_key
+
+    def get_tags_version(self):
+        """Generation of the `depends_on` tags, None without them."""
+        if self.tags:
+            return get_tags_version(self.tags, get_tags_cache(self.local))
+
+    def get_cache(self):
+        return get_two_tier_cache() if self.local else caches['default']
+
+    def get_codec(self):
+        if self._codec is None:
+            self._codec = get_value_codec(*self.codec_options)
+        return self._codec
+
+    def encode(self, value):
+        """Value as stored in cache and as it would be read back."""
+        codec = self.get_codec()
+        encoded = codec.encode(value)
+        return encoded, decode_value(encoded) if codec.lossy else value
+
+    def decode(self, value):
+        """Value as returned by the function from its cached form."""
+        if not is_encoded(value):
+            return value
+
+        start = time.perf_counter()
+        value = decode_value(value)
+        self.record(decodes=1, decode_seconds=time.perf_counter() - start)
+        return value
+
+    def record(self, **events):
+        """Record stats events, when SPLINT_CACHE_STATS is enabled."""
+        if stats.stats_enabled():
+            stats.record(self.stats_name, events)
+
+    def get_cached(self, instance, cache_key):
+        """Value from cache, computing it when missing or expired."""
+        cached, tier = get_with_tier(self.get_cache(), cache_key, _NOT_FOUND)
+        if cached is _NOT_FOUND:
+            self.record(misses=1)
+            return self.refresh(instance, cache_key)
+
+        value = self.unwrap(instance, cache_key, cached)
+        if value is _NOT_FOUND:
+            self.record(misses=1)
+            return self.refresh(
+                instance, cache_key, stale=self.decode(cached.value))
+        self.record(hits=1, **{f'{tier}_hits': 1})
+        return value
+
+    def is_expired(self, cached):
+        """Whether the soft expiration passed, maybe early (XFetch)."""
+        if cached.expires_at is None:
+            return False
+
+        now = time.time()
+        if self.early_expiration:
+            now -= cached.delta * self.early_expiration * math.log(
+                1 - random.random())
+        return now >= cached.expires_at
+
+    def refresh(self, instance, cache_key, stale=_NOT_FOUND):
+        """Compute the value, under the cache lock when enabled."""
+        if not self.lock:
+            return self.compute(instance, cache_key)
+
+        cache = self.get_cache()
+        lock_key = f'{cache_key}:lock'
+        if cache.add(lock_key, 1, self.lock_timeout):
             try:
-                cache_value = json.loads(cache_value)
-            except:
-                pass
+                return self.compute(instance, cache_key)
+            finally:
+                cache.delete(lock_key)
 
-        return cache_value
+        if stale is not _NOT_FOUND:
+            return stale
+
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            cached = cache.get(cache_key, _NOT_FOUND)
+            if cached is not _NOT_FOUND:
+                return self.decode(cached.value if isinstance(
+                    cached, CachedValue) else cached)
+        return self.compute(instance, cache_key)
+
+    def refresh_in_background(self, instance, cache_key):
+        """Refresh the value in a thread, unless another caller does it."""
+        cache = self.get_cache()
+        lock_key = f'{cache_key}:lock'
+        if not cache.add(lock_key, 1, self.lock_timeout):
+            return
+
+        def run():
+            try:
+                self.compute(instance, cache_key)
+            except Exception:
+                logger.exception(
+                    'Background refresh of %r failed.', self.name)
+            finally:
+                cache.delete(lock_key)
+                connections.close_all()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def compute(self, instance, cache_key):
+        """Call the function and store its value in cache."""
+        start = time.monotonic()
+        value = self.func(instance)
+        delta = time.monotonic() - start
+        encoded, value = self.encode(value)
+        cached, timeout = self.wrap(encoded, delta)
 
+        self.get_cache().set(key=cache_key, value=cached, timeout=timeout)
+        if stats.stats_enabled():
+            self.record(computes=1, compute_seconds=delta,
+                        value_bytes=stats.value_size(cached))
+        return value
+
+    def wrap(self, value, delta):
+        """Value as stored in cache and its cache timeout."""
+        timeout = self.cache_expires
+        if not (self.stale_ttl or self.early_expiration):
+            return value, timeout
+
+        cached = CachedValue(
+            value,
+            None if timeout is None else time.time() + timeout,
+            delta)
+        if timeout and self.stale_ttl:
+            timeout += self.stale_ttl
+        return cached, timeout
+
+    def unwrap(self, instance, cache_key, cached):
+        """Value of a cache hit, _NOT_FOUND when it must be recomputed."""
+        if not isinstance(cached, CachedValue):
+            return self.decode(cached)
+        if not self.is_expired(cached):
+            return self.decode(cached.value)
+        if self.stale_ttl:
+            self.refresh_in_background(instance, cache_key)
+            return self.decode(cached.value)
+        return _NOT_FOUND
+
+
+def prefetch_cached_properties(objs, *names, batch_func=None):
+    """Load splint_cached_property values of many objects at once.
+
+    Keys of every object and property are read with one `get_many` per
+    cache, the misses are computed (with `batch_func(name, objs)` returning
+    their values in order, when given) and written back with one
+    `set_many` per cache and timeout. Values are kept in each object
+    `__dict__`, as an access to the property would.
+
+    Usage: prefetch_cached_properties(students, 'studentgroups_actives')
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+
+    pending = []
+    keys = {}
+    for name in names:
+        prop = getattr(type(objs[0]), name)
+        if not isinstance(prop, splint_cached_property):
+            raise TypeError(f'{name!r} is not a splint_cached_property.')
+        tags_version = prop.get_tags_version()
+        for obj in objs:
+            if name not in obj.__dict__:
+                cache_key = prop.get_cache_key(obj, tags_version)
+                pending.append((prop, obj, cache_key))
+                keys.setdefault(prop.get_cache(), []).append(cache_key)
+
+    found = {}
+    local_keys = set()
+    for cache_, cache_keys in keys.items():
+        found[cache_], local = get_many_with_tiers(cache_, cache_keys)
+        local_keys.update(local)
+
+    misses = {}
+    for prop, obj, cache_key in pending:
+        cached = found[prop.get_cache()].get(cache_key, _NOT_FOUND)
+        value = _NOT_FOUND if cached is _NOT_FOUND else prop.unwrap(
+            obj, cache_key, cached)
+        if value is _NOT_FOUND:
+            misses.setdefault(prop, []).append((obj, cache_key))
+            prop.record(misses=1)
+        else:
+            obj.__dict__[prop.name] = value
+            tier = 'local' if cache_key in local_keys else 'shared'
+            prop.record(hits=1, **{f'{tier}_hits': 1})
+
+    to_set = {}
+    for prop, missing in misses.items():
+        start = time.monotonic()
+        if batch_func is not None:
+            values = batch_func(prop.name, [obj for obj, _ in missing])
+        else:
+            values = [prop.func(obj) for obj, _ in missing]
+        elapsed = time.monotonic() - start
+        delta = elapsed / len(missing)
+
+        value_bytes = 0
+        for (obj, cache_key), value in zip(missing, values):
+            encoded, obj.__dict__[prop.name] = prop.encode(value)
+            cached, timeout = prop.wrap(encoded, delta)
+            to_set.setdefault(
+                (prop.get_cache(), timeout), {})[cache_key] = cached
+            if stats.stats_enabled():
+                value_bytes += stats.value_size(cached)
+        prop.record(computes=len(missing), compute_seconds=elapsed,
+                    value_bytes=value_bytes)
+
+    for (cache_, timeout), values in to_set.items():
+        cache_.set_many(values, timeout=timeout)
+    return objs
+
+
+class _CachedNone:
+    """Marker of a cached None, unpickled as the CACHED_NONE singleton."""
+
+    def __reduce__(self):
+        return 'CACHED_NONE'
+
+
+CACHED_NONE = _CachedNone()
+
+
+def _args_key_default(value):
+    if isinstance(value, models.Model):
+        return f'{value._meta.label}:{value.pk}'
+    return str(value)
+
+
+def args_cache_key(base_key, arguments):
+    """Cache key of a call, the base key with a hash of its arguments."""
+    if not arguments:
+        return base_key
+
+    arguments = json.dumps(
+        arguments, sort_keys=True, default=_args_key_default,
+        separators=(',', ':'))
+    return f'{base_key}:{hashlib.md5(arguments.encode()).hexdigest()}'
+
+
+def splint_cached_function(timeout, *, cache_alias='default', key_prefix='',
+                           local=False, key_func=None, depends_on=None,
+                           codec=None, compression=None,
+                           compression_threshold=None):
+    """Cache the result of a method, per instance and arguments.
+
+    The key is built by `key_func(self, *args, **kwargs)` when given,
+    otherwise from `self.get_cache_key(key_prefix)` and a hash of the
+    arguments (bound to the method signature, with defaults). The method
+    only runs on cache misses, None results are cached too.
+
+    Cached results are removed with `Model.method.invalidate(obj, *args)`
+    or, for many objects, `Model.method.invalidate_many(objs, *args)`, and
+    by writes to the `depends_on` models or fields. `codec`, `compression`
+    and `compression_threshold` are the ones of splint_cached_property.
+    """
+    tags = register_dependencies(depends_on) if depends_on else []
+    value_codec = None
+
+    def get_cache():
+        if local:
+            return get_two_tier_cache(cache_alias)
+        return caches[cache_alias]
 
-def splint_cached_function(timeout, *, cache_alias='default', key_prefix=''):
     def decorator(func):
+        signature = inspect.signature(func)
+        stats_name = f'{func.__module__}.{func.__qualname__}'
+
+        def get_key(self, args, kwargs):
+            if key_func is not None:
+                cache_key = key_func(self, *args, **kwargs)
+            else:
+                try:
+                    base_key = getattr(self, 'get_cache_key')(key_prefix)
+                except (AttributeError, TypeError):
+                    raise NotImplementedError(
+                        'Function get_cache_key not implemented in ' +
+                        f'{self.__class__.__name__}')
+
+                bound = signature.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                arguments = list(bound.arguments.items())[1:]
+                cache_key = args_cache_key(base_key, dict(arguments))
+
+            if tags:
+                cache_key += \
+                    f':{get_tags_version(tags, get_tags_cache(local))}'
+            return cache_key
+
+        def get_codec():
+            nonlocal value_codec
+            if value_codec is None:
+                value_codec = get_value_codec(
+                    codec, compression, compression_threshold)
+            return value_codec
+
         @wraps(func)
         def wrapper(self, *args, **kwargs):
-            cache = caches[cache_alias]
-            try:
-                cache_key = getattr(self, 'get_cache_key')(key_prefix)
-            except TypeError:
-                raise NotImplementedError(
-                    'Function get_cache_key not implemented in ' +
-                    f'{self.__class__.__name__}')
-            return cache.get_or_set(
-                key=cache_key,
-                default=func(self, *args, **kwargs),
-                timeout=timeout)
+            cache = get_cache()
+            cache_key = get_key(self, args, kwargs)
+
+            enabled = stats.stats_enabled()
+            value, tier = get_with_tier(cache, cache_key, _NOT_FOUND)
+            if value is _NOT_FOUND:
+                start = time.monotonic()
+                value = func(self, *args, **kwargs)
+                delta = time.monotonic() - start
+                cached = get_codec().encode(value)
+                if get_codec().lossy:
+                    value = decode_value(cached)
+                if cached is None:
+                    cached = CACHED_NONE
+                cache.set(cache_key, cached, timeout=timeout)
+                if enabled:
+                    stats.record(stats_name, {
+                        'misses': 1,
+                        'computes': 1,
+                        'compute_seconds': delta,
+                        'value_bytes': stats.value_size(cached),
+                    })
+            else:
+                if enabled:
+                    stats.record(stats_name, {'hits': 1, f'{tier}_hits': 1})
+                if isinstance(value, _CachedNone):
+                    value = None
+                elif is_encoded(value):
+                    start = time.perf_counter()
+                    value = decode_value(value)
+                    if enabled:
+                        stats.record(stats_name, {
+                            'decodes': 1,
+                            'decode_seconds': time.perf_counter() - start,
+                        })
+            return value
+
+        def invalidate(self, *args, **kwargs):
+            get_cache().delete(get_key(self, args, kwargs))
+
+        def invalidate_many(instances, *args, **kwargs):
+            get_cache().delete_many(
+                [get_key(self, args, kwargs) for self in instances])
+
+        wrapper.invalidate = invalidate
+        wrapper.invalidate_many = invalidate_many
         return wrapper
     return decorator
@@ -0,0 +1,193 @@
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'splint:stats:v1:{}'
+SNAPSHOT_INDEX_KEY = 'splint:stats:v1:index'
+
+# Events recorded per decorator, counts unless suffixed with their unit.
+EVENTS = (
+    'hits', 'local_hits', 'shared_hits', 'misses', 'computes',
+    'compute_seconds', 'value_bytes', 'decodes', 'decode_seconds',
+)
+
+# Sent with the decorator `name` and its `events` ({event: value}) when
+# SPLINT_CACHE_STATS is enabled.
+cache_event = Signal()
+
+
+class CacheStats:
+    """Thread safe, in-process counters of the cache decorators."""
+
+    def __init__(self):
+        """Constructor."""
+        self._stats = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+        self.published_at = 0
+
+    def add(self, name, events):
+        with self._lock:
+            stats = self._stats[name]
+            for event, value in events.items():
+                stats[event] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+registry = CacheStats()
+
+_hooks = None
+
+
+def stats_enabled():
+    return getattr(settings, 'SPLINT_CACHE_STATS', False)
+
+
+def get_hooks():
+    """Callables at `SPLINT_CACHE_STATS_HOOKS`, called as hook(name, events)."""
+    global _hooks
+    if _hooks is None:
+        _hooks = [
+            import_string(path)
+            for path in getattr(settings, 'SPLINT_CACHE_STATS_HOOKS', [])
+        ]
+    return _hooks
+
+
+def record(name, events):
+    """Add the events of a decorator to the registry and notify them."""
+    registry.add(name, events)
+    for hook in get_hooks():
+        try:
+            hook(name, events)
+        except Exception:
+            logger.exception('Cache stats hook %r failed.', hook)
+    if cache_event.has_listeners():
+        cache_event.send(sender=CacheStats, name=name, events=events)
+
+    interval = getattr(settings, 'SPLINT_CACHE_STATS_PUBLISH_INTERVAL', 60)
+    if time.monotonic() - registry.published_at >= interval:
+        publish()
+
+
+def value_size(value):
+    """Approximate size of a cached value, as pickled by the cache."""
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def publish():
+    """Store the stats of this process in cache, read by `collect`.
+
+    Snapshots expire after ten publish intervals without updates, so stopped
+    processes leave the report.
+    """
+    registry.published_at = time.monotonic()
+    interval = getattr(settings, 'SPLINT_CACHE_STATS_PUBLISH_INTERVAL', 60)
+    key = SNAPSHOT_KEY.format(f'{socket.gethostname()}:{os.getpid()}')
+    try:
+        cache.set(key, registry.snapshot(), timeout=interval * 10)
+        index = cache.get(SNAPSHOT_INDEX_KEY) or []
+        if key not in index:
+            alive = cache.get_many(index)
+            cache.set(
+                SNAPSHOT_INDEX_KEY, [k for k in index if k in alive] + [key],
+                timeout=None)
+    except Exception:
+        logger.exception('Publishing cache stats failed.')
+
+
+def collect():
+    """Stats of every process published in cache, summed per decorator."""
+    index = cache.get(SNAPSHOT_INDEX_KEY) or []
+    totals = defaultdict(lambda: defaultdict(float))
+    for snapshot in cache.get_many(index).values():
+        for name, stats in snapshot.items():
+            for event, value in stats.items():
+                totals[name][event] += value
+    return {name: dict(stats) for name, stats in totals.items()}
+
+
+def report(stats, top=20, sort='misses'):
+    """Rows of the `top` decorators by `sort` event, with derived ratios."""
+    rows = []
+    for name, events in stats.items():
+        row = {event: events.get(event, 0) for event in EVENTS}
+        reads = row['hits'] + row['misses']
+        row.update(
+            name=name,
+            hit_ratio=row['hits'] / reads if reads else 0,
+            local_ratio=row['local_hits'] / row['hits'] if row['hits'] else 0,
+            avg_compute_ms=(
+                row['compute_seconds'] * 1000 / row['computes']
+                if row['computes'] else 0),
+            avg_value_bytes=(
+                row['value_bytes'] / row['computes'] if row['computes'] else 0),
+        )
+        rows.append(row)
+    rows.sort(key=lambda row: row.get(sort, 0), reverse=True)
+    return rows[:top]
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def prometheus_text(stats):
+    """Stats in the Prometheus text exposition format."""
+    lines = []
+    for event in EVENTS:
+        metric = f'splint_cache_{event}_total'
+        lines.append(f'# TYPE {metric} counter')
+        for name, events in sorted(stats.items()):
+            if event in events:
+                lines.append(
+                    f'{metric}{{name="{_label(name)}"}} {events[event]:g}')
+    return '\n'.join(lines) + '\n'
+
+
+_statsd_socket = None
+
+
+def statsd_hook(name, events):
+    """Hook sending the events to statsd over UDP.
+
+    Configured with `SPLINT_STATSD_HOST` (default 'localhost'),
+    `SPLINT_STATSD_PORT` (default 8125) and `SPLINT_STATSD_PREFIX` (default
+    'splint.cache').
+    """
+    global _statsd_socket
+    if _statsd_socket is None:
+        _statsd_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    prefix = getattr(settings, 'SPLINT_STATSD_PREFIX', 'splint.cache')
+    lines = []
+    for event, value in events.items():
+        if event.endswith('_seconds'):
+            lines.append(f'{prefix}.{name}.{event[:-8]}:{value * 1000:g}|ms')
+        else:
+            lines.append(f'{prefix}.{name}.{event}:{value:g}|c')
+    _statsd_socket.sendto('\n'.join(lines).encode(), (
+        getattr(settings, 'SPLINT_STATSD_HOST', 'localhost'),
+        getattr(settings, 'SPLINT_STATSD_PORT', 8125),
+    ))